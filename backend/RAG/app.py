@@ -7,11 +7,8 @@ from pydantic import BaseModel
 from RAG.chatbot import chatbot_response
 from RAG.report_generation import report_generation
 from utils import convert_md_to_pdf
-from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
+from database import get_db
 
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
 route_rag = APIRouter()
 
 class ChatRequest(BaseModel):
@@ -41,8 +38,7 @@ async def generate_report(request: ReportRequest):
             request.doctor_id
         )
 
-        client = AsyncIOMotorClient(MONGO_URI)
-        db = client.get_default_database()
+        db = get_db()
 
         # 2) Save HTML file
         dir_path = f"./patient/{request.patient_id}"
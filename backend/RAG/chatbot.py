@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
-from llama_index.llms.gemini import Gemini
 from RAG.query import search_pinecone
+from RAG.report_generation import llm as gemini_llm
 
 # Load environment variables
 load_dotenv()
@@ -11,8 +11,8 @@ def chatbot_response(query):
     """
     Generates a structured medical response based on retrieved study materials.
     """
-    # Initialize Gemini model
-    llm = Gemini(model="models/gemini-2.0-flash")
+    # Shared Gemini client, created on first use
+    llm = gemini_llm.get()
     
     # Use Gemini to determine if the query is conversational
     conversation_check = llm.complete(
@@ -1,22 +1,29 @@
-from pinecone import Pinecone
 import os
 from dotenv import load_dotenv
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from registry import lazy_resource
 
 load_dotenv()  
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 GOOGLE_API_KEY=os.getenv("GEMINI_API_KEY")
-pc = Pinecone(api_key=PINECONE_API_KEY)
 index_name = "my-gemini-index"
-index = pc.Index(index_name)
 
-embedding_model = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001", google_api_key=GOOGLE_API_KEY
-)
+def load_index():
+    from pinecone import Pinecone
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    return pc.Index(index_name)
+
+def load_embedding_model():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(
+        model="models/embedding-001", google_api_key=GOOGLE_API_KEY
+    )
+
+index = lazy_resource("pinecone_index", load_index)
+embedding_model = lazy_resource("embedding_model", load_embedding_model)
 
 def search_pinecone(query_text):
-    query_embedding = embedding_model.embed_query(query_text)
-    results = index.query(
+    query_embedding = embedding_model.get().embed_query(query_text)
+    results = index.get().query(
         vector=query_embedding, 
         top_k=5, 
         include_metadata=True
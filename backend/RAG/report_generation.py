@@ -1,15 +1,19 @@
 import os
 from dotenv import load_dotenv
 import requests
-from llama_index.llms.gemini import Gemini
+from registry import lazy_resource
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-llm = Gemini(
-    model="models/gemini-2.0-flash",
-)
+def load_llm():
+    from llama_index.llms.gemini import Gemini
+    return Gemini(
+        model="models/gemini-2.0-flash",
+    )
+
+llm = lazy_resource("gemini_llm", load_llm)
 
 # patient_details={
 #   "name": "admin",
@@ -188,7 +192,7 @@ def report_generation(data_json,patient_id,doctor_id):
     with open("./RAG/template.txt", "r") as file:   #TODO : add the relative path kuch to gadbad hai
         template = file.read()
     
-    response = llm.complete(
+    response = llm.get().complete(
         f"""
         Follow the following steps to generate a report in html format and start with : {template} 
         
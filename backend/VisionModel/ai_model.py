@@ -1,16 +1,26 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Body
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Body, status
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+import asyncio
+import zlib
 import nibabel as nib
 import numpy as np
-import cv2
 import os
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
-import tempfile
-from tensorflow import keras
-from keras import backend as K
 from dotenv import load_dotenv
 import json
+from VisionModel.jobs import job_manager, MRI_WORKER_MODE
+from VisionModel.batching import MicroBatcher
+from VisionModel.preprocessing import build_model_input, foreground_extent
+from VisionModel.result_cache import result_cache, model_identity
+from VisionModel.storage import StudyWorkspace, DEFAULT_STUDY_ID
+from VisionModel.geometry import ResampledGeometry
+from VisionModel.metadata import read_header, header_details, volume_details
+from VisionModel.statistics import tumor_statistics
+from VisionModel.uploads import stream_upload
+from VisionModel.tiling import build_native_input, predict_tiled, downsample_probabilities, MRI_TILE_OVERLAP
+from VisionModel.backends import create_backend, active_model_path, SEGMENTATION_BACKEND
+from registry import lazy_resource
 
 router = APIRouter()
 
@@ -18,109 +28,194 @@ load_dotenv()
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 
 MODEL_PATH = os.getenv("MODEL_PATH")
+MRI_CROP_EMPTY_SLICES = os.getenv("MRI_CROP_EMPTY_SLICES", "1") == "1"
 
-# Create base directory for patient data
-PATIENT_DATA_DIR = "./patient_data/mri_scans/user"  
-os.makedirs(PATIENT_DATA_DIR, exist_ok=True)
-
-# Custom metrics for model evaluation
-def dice_coef(y_true, y_pred, smooth=1.0):
-    class_num = 4
-    total_loss = 0
-    for i in range(class_num):
-        y_true_f = K.flatten(y_true[:,:,:,i])
-        y_pred_f = K.flatten(y_pred[:,:,:,i])
-        intersection = K.sum(y_true_f * y_pred_f)
-        loss = ((2. * intersection + smooth) / (K.sum(y_true_f) + K.sum(y_pred_f) + smooth))
-        total_loss += loss
-    return total_loss / class_num
-
-def precision(y_true, y_pred):
-    true_positives = K.sum(K.round(K.clip(y_true * y_pred, 0, 1)))
-    predicted_positives = K.sum(K.round(K.clip(y_pred, 0, 1)))
-    return true_positives / (predicted_positives + K.epsilon())
-
-def sensitivity(y_true, y_pred):
-    true_positives = K.sum(K.round(K.clip(y_true * y_pred, 0, 1)))
-    possible_positives = K.sum(K.round(K.clip(y_true, 0, 1)))
-    return true_positives / (possible_positives + K.epsilon())
-
-def specificity(y_true, y_pred):
-    true_negatives = K.sum(K.round(K.clip((1-y_true) * (1-y_pred), 0, 1)))
-    possible_negatives = K.sum(K.round(K.clip(1-y_true, 0, 1)))
-    return true_negatives / (possible_negatives + K.epsilon())
-
-def dice_coef_necrotic(y_true, y_pred, epsilon=1e-6):
-    intersection = K.sum(K.abs(y_true[:,:,:,1] * y_pred[:,:,:,1]))
-    return (2. * intersection) / (K.sum(K.square(y_true[:,:,:,1])) + K.sum(K.square(y_pred[:,:,:,1])) + epsilon)
-
-def dice_coef_edema(y_true, y_pred, epsilon=1e-6):
-    intersection = K.sum(K.abs(y_true[:,:,:,2] * y_pred[:,:,:,2]))
-    return (2. * intersection) / (K.sum(K.square(y_true[:,:,:,2])) + K.sum(K.square(y_pred[:,:,:,2])) + epsilon)
-
-def dice_coef_enhancing(y_true, y_pred, epsilon=1e-6):
-    intersection = K.sum(K.abs(y_true[:,:,:,3] * y_pred[:,:,:,3]))
-    return (2. * intersection) / (K.sum(K.square(y_true[:,:,:,3])) + K.sum(K.square(y_pred[:,:,:,3])) + epsilon)
-
-custom_objects = {
-    "dice_coef": dice_coef,
-    "precision": precision,
-    "sensitivity": sensitivity,
-    "specificity": specificity,
-    "dice_coef_necrotic": dice_coef_necrotic,
-    "dice_coef_edema": dice_coef_edema,
-    "dice_coef_enhancing": dice_coef_enhancing
-}
-
-model = keras.models.load_model(MODEL_PATH, custom_objects=custom_objects, compile=False)
+# Legacy location of the default study; per-study directories live next to it
+PATIENT_DATA_DIR = StudyWorkspace(DEFAULT_STUDY_ID).ensure().dir
 
 IMG_SIZE = 128
 VOLUME_SLICES = 155
 VOLUME_START_AT = 0
 
+# Still importable from here, as before the move to VisionModel.metrics, but
+# resolved on first access so that importing this module does not pull in TensorFlow
+_METRIC_EXPORTS = (
+    "custom_objects", "dice_coef", "precision", "sensitivity", "specificity",
+    "dice_coef_necrotic", "dice_coef_edema", "dice_coef_enhancing",
+)
+
+def __getattr__(name):
+    if name in _METRIC_EXPORTS:
+        from VisionModel import metrics
+        return getattr(metrics, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def load_segmentation_model():
+    """Loads the segmentation model behind the backend selected by SEGMENTATION_BACKEND."""
+    # The Keras custom objects are imported by create_backend, and only for the Keras backend
+    return create_backend(SEGMENTATION_BACKEND, keras_model_path=MODEL_PATH)
+
+def warm_up_segmentation_model(backend):
+    """Runs one blank slice through the model so tracing and allocation happen before the first study."""
+    backend.predict(np.zeros((1, IMG_SIZE, IMG_SIZE, 2), dtype=np.float32))
+
+# In process mode the API process never runs inference; readiness waits on the workers instead
+segmentation_model = lazy_resource(
+    "segmentation_model",
+    load_segmentation_model,
+    warm_on_startup=MRI_WORKER_MODE == "thread",
+    warmup=warm_up_segmentation_model,
+    required=MRI_WORKER_MODE == "thread",
+)
+if MRI_WORKER_MODE == "process":
+    lazy_resource("mri_workers", job_manager.start_workers, required=True)
+
+# Concurrent predictions in this process share forward passes through the batcher
+batcher = MicroBatcher(lambda batch: segmentation_model.get().predict(batch))
+
+SEGMENT_CLASSES = {
+    0: "background",
+    1: "necrotic",
+    2: "edema",
+    3: "enhancing",
+}
+PROBABILITY_FORMATS = ("none", "uint8", "float32")
+# "resample" runs the model on slices shrunk to IMG_SIZE; "tiled" runs it on
+# overlapping IMG_SIZE tiles of the native slices (see VisionModel/tiling.py)
+INFERENCE_MODES = ("resample", "tiled")
+
+# Pipeline outputs are uncompressed working copies that readers can memory-map;
+# gzip only happens when a file is exported through /api/mri/studies/.../files
+RESIZED_FLAIR_FILE = "resize_flair.nii"
+RESIZED_T1CE_FILE = "resize_t1ce.nii"
+SEGMENTATION_FILE = "segmentation_output.nii"
+NATIVE_SEGMENTATION_FILE = "segmentation_native.nii"
+PROBABILITY_FILE = "probabilities.nii"
+
 # Removed unused preprocess_image and predict functions
 
-def predictByPath(file_t1ce, file_flair):
-    X = np.empty((VOLUME_SLICES, IMG_SIZE, IMG_SIZE, 2))
-    
-    vol_path = file_flair
-    flair = nib.load(f"../backend/patient_data/mri_scans/user/{file_flair}").get_fdata()
-    
-    vol_path = file_t1ce
-    ce = nib.load(f"../backend/patient_data/mri_scans/user/{file_t1ce}").get_fdata()
-    
-    for j in range(VOLUME_SLICES):
-        X[j,:,:,0] = cv2.resize(flair[:,:,j+VOLUME_START_AT], (IMG_SIZE,IMG_SIZE))
-        X[j,:,:,1] = cv2.resize(ce[:,:,j+VOLUME_START_AT], (IMG_SIZE,IMG_SIZE))
-    t1ce_path = os.path.join(PATIENT_DATA_DIR, "resize_t1ce.nii.gz")
-    flair_path = os.path.join(PATIENT_DATA_DIR, "resize_flair.nii.gz")
-    save_nifti(np.transpose(X[:,:,:,0], (1, 2, 0)), flair_path)
-    save_nifti(np.transpose(X[:,:,:,1], (1, 2, 0)), t1ce_path)
-    return model.predict(X/np.max(X), verbose=1)
-
-def save_nifti(data, file_path):
-    data = data.astype(np.float32)
-    nifti_img = nib.Nifti1Image(data, np.eye(4))
-    nib.save(nifti_img, file_path)
+def pipeline_identity(inference_mode):
+    """
+    Everything besides the inputs that decides the pipeline output: the model
+    file, the inference mode and the settings that shape the model grid
+    (and, in tiled mode, the tile layout). Part of the result cache key, so
+    changing any of them misses the cache.
+    """
+    identity = (
+        f"{model_identity(active_model_path())}:{inference_mode}"
+        f":size={IMG_SIZE}:start={VOLUME_START_AT}:depth={VOLUME_SLICES}:crop={int(MRI_CROP_EMPTY_SLICES)}"
+    )
+    if inference_mode == "tiled":
+        # MRI_TILE_SLICES only groups slices into forward passes, so it is left out
+        identity += f":tile={IMG_SIZE}:overlap={MRI_TILE_OVERLAP!r}"
+    return identity
+
+def predictByPath(workspace, file_t1ce, file_flair, geometry):
+    X = build_model_input(
+        workspace.path(file_flair), workspace.path(file_t1ce),
+        size=IMG_SIZE, depth=VOLUME_SLICES, start=VOLUME_START_AT,
+    )
+
+    save_nifti(np.transpose(X[:,:,:,0], (1, 2, 0)), workspace, RESIZED_FLAIR_FILE, geometry)
+    save_nifti(np.transpose(X[:,:,:,1], (1, 2, 0)), workspace, RESIZED_T1CE_FILE, geometry)
+
+    # Slices outside the brain are left as background instead of going through the model
+    extent = foreground_extent(X)
+    prediction = np.zeros((VOLUME_SLICES, IMG_SIZE, IMG_SIZE, len(SEGMENT_CLASSES)), dtype=np.float32)
+    prediction[..., 0] = 1.0
+    if extent is not None:
+        start, stop = extent["z"] if MRI_CROP_EMPTY_SLICES else (0, VOLUME_SLICES)
+        X /= np.max(X)
+        prediction[start:stop] = batcher.predict(X[start:stop])
+    return prediction, extent
+
+def predictTiledByPath(workspace, file_t1ce, file_flair, geometry):
+    """
+    Tiled counterpart of predictByPath. Returns the probabilities resampled
+    onto the model grid, for the viewer files and the cache, together with
+    the (x, y, z) label volume on the native grid.
+    """
+    X = build_model_input(
+        workspace.path(file_flair), workspace.path(file_t1ce),
+        size=IMG_SIZE, depth=VOLUME_SLICES, start=VOLUME_START_AT,
+    )
+    save_nifti(np.transpose(X[:,:,:,0], (1, 2, 0)), workspace, RESIZED_FLAIR_FILE, geometry)
+    save_nifti(np.transpose(X[:,:,:,1], (1, 2, 0)), workspace, RESIZED_T1CE_FILE, geometry)
+    extent = foreground_extent(X)
+    del X
+
+    native = build_native_input(
+        workspace.path(file_flair), workspace.path(file_t1ce), start=VOLUME_START_AT, depth=VOLUME_SLICES,
+    )
+    native_prediction = np.zeros(native.shape[:3] + (len(SEGMENT_CLASSES),), dtype=np.float32)
+    native_prediction[..., 0] = 1.0
+    if extent is not None:
+        start, stop = extent["z"] if MRI_CROP_EMPTY_SLICES else (0, len(native))
+        native /= np.max(native)
+        native_prediction[start:stop] = predict_tiled(
+            native[start:stop], batcher.predict, tile=IMG_SIZE, num_classes=len(SEGMENT_CLASSES),
+        )
+    del native
+
+    native_labels = np.zeros(geometry.source_shape, dtype=np.uint8)
+    slab = np.argmax(native_prediction, axis=-1).astype(np.uint8)
+    native_labels[:, :, VOLUME_START_AT:VOLUME_START_AT + len(slab)] = np.transpose(slab, (1, 2, 0))
+    prediction = downsample_probabilities(native_prediction, IMG_SIZE)
+    return prediction, native_labels, extent
+
+def save_nifti(data, workspace, name, geometry, dtype=np.float32):
+    nifti_img = geometry.image(data.astype(dtype, copy=False))
+    _write_nifti(nifti_img, workspace, name)
+
+def _write_nifti(nifti_img, workspace, name):
+    with workspace.atomic_path(name) as tmp_path:
+        nib.save(nifti_img, tmp_path)
+
+def _tag_labels(header):
+    header.set_intent("label", name="tumor labels")
+    header["cal_min"] = 0
+    header["cal_max"] = len(SEGMENT_CLASSES) - 1
+    header["descrip"] = " ".join(f"{k}={v}" for k, v in SEGMENT_CLASSES.items()).encode("ascii")[:80]
+
+def save_label_map(segmentation, workspace, name, geometry):
+    """Writes an argmax label volume on the model grid as uint8 tagged with the NIfTI label intent."""
+    nifti_img = geometry.image(segmentation.astype(np.uint8))
+    _tag_labels(nifti_img.header)
+    _write_nifti(nifti_img, workspace, name)
+
+def save_native_label_map(native_labels, workspace, name, geometry):
+    """Saves a label volume on the scan's native grid with the source header."""
+    nifti_img = geometry.native_image(native_labels.astype(np.uint8))
+    _tag_labels(nifti_img.header)
+    _write_nifti(nifti_img, workspace, name)
+
+def save_probability_maps(prediction, workspace, probability_format, geometry):
+    """
+    Writes the tumor-class probabilities (classes 1-3) as one 4-D volume.
+    "uint8" stores round(p * 255) with scl_slope = 1/255, so viewers still
+    read probabilities in [0, 1]; "float32" keeps full precision.
+    """
+    probabilities = np.transpose(prediction[..., 1:], (1, 2, 0, 3))
+    if probability_format == "uint8":
+        quantized = np.rint(np.clip(probabilities, 0, 1) * 255).astype(np.uint8)
+        nifti_img = geometry.image(quantized)
+        nifti_img.header.set_slope_inter(1 / 255, 0)
+    else:
+        nifti_img = geometry.image(probabilities.astype(np.float32))
+    _write_nifti(nifti_img, workspace, PROBABILITY_FILE)
+    return PROBABILITY_FILE
 
 def extract_mri_details(nifti_image):
-    header = nifti_image.header
-    details = {
-        "dimensions": [int(dim) for dim in nifti_image.shape],
-        "voxel_size": [float(vx) for vx in header.get_zooms()],
-        "slice_thickness": f"{float(header.get_zooms()[2])}mm",
-        "data_type": str(header.get_data_dtype())
-    }
-    if 'descrip' in header:
-        details['description'] = header['descrip'].item().decode('utf-8')
-    return details
-
-def extract_prediction_details(segmentation):
-    region_volumes = {
-        "necrotic_tissue_volume": int(np.sum(segmentation == 1)),
-        "edema_volume": int(np.sum(segmentation == 2)),
-        "enhancing_tumor_volume": int(np.sum(segmentation == 3))
-    }
+    return header_details(nifti_image.header)
+
+def extract_prediction_details(segmentation, voxel_size=(1.0, 1.0, 1.0), affine=None):
+    """
+    Summary of an (x, y, z) label volume: the percentages the report template
+    uses, plus the physical volumes, lesions and slice profiles from
+    `tumor_statistics`.
+    """
+    statistics = tumor_statistics(segmentation, voxel_size, affine, num_classes=len(SEGMENT_CLASSES))
+    region_volumes = statistics["voxel_counts"]
 
     total_volume = np.prod(segmentation.shape)
     insights = {
@@ -128,74 +223,349 @@ def extract_prediction_details(segmentation):
             region: f"{(volume / total_volume) * 100:.2f}%" 
             for region, volume in region_volumes.items()
         },
-        "abnormalities_detected": any(volume > 0 for volume in region_volumes.values())
+        "abnormalities_detected": any(volume > 0 for volume in region_volumes.values()),
+        **statistics,
     }
     return insights
 
+def get_workspace(study_id, must_exist=True):
+    try:
+        workspace = StudyWorkspace(study_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if must_exist and not workspace.exists():
+        raise HTTPException(status_code=404, detail="Study not found")
+    return workspace
+
 # Helper function to handle file uploads
-async def save_uploaded_file(file: UploadFile, file_type: str):
+async def save_uploaded_file(file: UploadFile, file_type: str, study_id: str = DEFAULT_STUDY_ID):
     if not file.filename.endswith(".nii.gz"):
         raise HTTPException(status_code=400, detail=f"Only .nii.gz files are accepted for {file_type}")
-    
+    workspace = get_workspace(study_id, must_exist=study_id != DEFAULT_STUDY_ID)
     try:
-        # Create patient directory structure
-        patient_dir = PATIENT_DATA_DIR
-        os.makedirs(patient_dir, exist_ok=True)
-        
-        # Save file
-        file_path = os.path.join(patient_dir, file.filename)
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        
-        return JSONResponse(
-            content={"message": f"{file_type} file saved successfully at {file_path}"},
-            status_code=200
-        )
+        file_path = workspace.ensure().path(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        info = await stream_upload(file, workspace, file.filename)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid {file_type} file: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving {file_type} file: {str(e)}")
 
+    return JSONResponse(
+        content={"message": f"{file_type} file saved successfully at {file_path}", "study_id": study_id, **info},
+        status_code=200
+    )
+
+@router.post("/api/mri/studies", status_code=status.HTTP_201_CREATED)
+async def create_study():
+    workspace = await asyncio.to_thread(StudyWorkspace.create)
+    return {"study_id": workspace.study_id}
+
+@router.delete("/api/mri/studies/{study_id}")
+async def delete_study(study_id: str):
+    if study_id == DEFAULT_STUDY_ID:
+        raise HTTPException(status_code=400, detail="The default study cannot be deleted")
+    workspace = get_workspace(study_id)
+    await asyncio.to_thread(workspace.delete)
+    return {"message": f"Study {study_id} deleted"}
+
+@router.get("/api/mri/studies/{study_id}/metadata")
+async def get_study_metadata(study_id: str):
+    """Header details of every volume in a study, keyed by file name."""
+    workspace = get_workspace(study_id)
+    names = sorted(
+        name for name in os.listdir(workspace.dir)
+        if not name.startswith(".") and name.endswith((".nii", ".nii.gz"))
+    )
+    metadata = {}
+    for name in names:
+        try:
+            metadata[name] = await asyncio.to_thread(volume_details, workspace.path(name))
+        except Exception as e:
+            metadata[name] = {"error": str(e)}
+    return metadata
+
+@router.get("/api/mri/studies/{study_id}/metadata/{name}")
+async def get_volume_metadata(study_id: str, name: str):
+    workspace = get_workspace(study_id)
+    try:
+        path = workspace.path(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        return await asyncio.to_thread(volume_details, path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read NIfTI header: {str(e)}")
+
+@router.get("/api/mri/studies/{study_id}/files/{name}")
+def export_study_file(study_id: str, name: str, compress: bool = True):
+    """
+    Downloads a study file. Uncompressed working copies are gzip-compressed
+    on the fly unless `compress=false`.
+    """
+    workspace = get_workspace(study_id)
+    try:
+        path = workspace.path(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if name.startswith(".") or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    if not compress or name.endswith(".gz"):
+        return FileResponse(path, filename=name, media_type="application/octet-stream")
+    return StreamingResponse(
+        _gzip_file(path),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{name}.gz"'},
+    )
+
+def _gzip_file(path, chunk_size=1024 * 1024):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.flush()
+
 @router.post("/api/mri/upload/t1ce")
-async def upload_t1ce_file(t1ce_file: UploadFile = File(...)):
-    return await save_uploaded_file(t1ce_file, "T1CE")
+async def upload_t1ce_file(t1ce_file: UploadFile = File(...), study_id: str = Form(DEFAULT_STUDY_ID)):
+    return await save_uploaded_file(t1ce_file, "T1CE", study_id)
 
 @router.post("/api/mri/upload/flair")
-async def upload_flair_file(flair_file: UploadFile = File(...)):
-    return await save_uploaded_file(flair_file, "FLAIR")
+async def upload_flair_file(flair_file: UploadFile = File(...), study_id: str = Form(DEFAULT_STUDY_ID)):
+    return await save_uploaded_file(flair_file, "FLAIR", study_id)
+
+def restore_cached_result(cache_key, workspace, probability_maps, geometry):
+    """
+    Restores a cached result into `workspace`. Returns (details,
+    probability_file), or None on a miss, including an entry evicted midway.
+    """
+    cached = result_cache.get(cache_key)
+    if cached is None:
+        return None
+    prediction = None
+    if probability_maps != "none":
+        try:
+            # Memory-mapped, so the maps stay readable even if the entry is evicted now
+            _, prediction = result_cache.load_arrays(cache_key)
+        except FileNotFoundError:
+            return None
+    if not result_cache.restore(cached, workspace):
+        return None
+    probability_file = None
+    if prediction is not None:
+        probability_file = save_probability_maps(prediction, workspace, probability_maps, geometry)
+    return cached["details"], probability_file
+
+def run_prediction(t1ce_filename, flair_filename, progress=None, study_id=DEFAULT_STUDY_ID, probability_maps="none",
+                   inference_mode="resample", cache_only=False):
+    """
+    Runs the full segmentation pipeline for one T1CE/FLAIR pair of a study
+    and returns a JSON-serialisable result. `progress(stage, fraction)` is
+    called as the pipeline moves between stages. Probability maps are only
+    written when `probability_maps` names one of PROBABILITY_FORMATS other
+    than "none". `inference_mode` is one of INFERENCE_MODES; in "tiled" mode
+    the native segmentation and the statistics come from full-resolution
+    tiles instead of the upsampled model-grid labels. With `cache_only`, a
+    cache miss returns None instead of running the model.
+    """
+    if progress is None:
+        progress = lambda stage, fraction: None
+
+    workspace = StudyWorkspace(study_id)
+    t1ce_path = workspace.path(t1ce_filename)
+    flair_path = workspace.path(flair_filename)
+    output_path = workspace.path(SEGMENTATION_FILE)
+    # Only the header is read here; voxel data stays on disk
+    source_header = read_header(t1ce_path)
+    geometry = ResampledGeometry(source_header, (IMG_SIZE, IMG_SIZE), start=VOLUME_START_AT, depth=VOLUME_SLICES)
+
+    progress("hashing", 0.05)
+    cache_key = result_cache.key(t1ce_path, flair_path, pipeline_identity(inference_mode)) if result_cache else None
+    restored = restore_cached_result(cache_key, workspace, probability_maps, geometry) if result_cache else None
+
+    probability_file = None
+    if restored is not None:
+        progress("restoring", 0.5)
+        details, probability_file = restored
+        mri_details = details["mri_details"]
+        prediction_details = details["prediction_details"]
+        extent = details["foreground_extent"]
+    elif cache_only:
+        return None
+    else:
+        progress("inference", 0.1)
+        if inference_mode == "tiled":
+            prediction, native_labels, extent = predictTiledByPath(workspace, t1ce_filename, flair_filename, geometry)
+        else:
+            prediction, extent = predictByPath(workspace, t1ce_filename, flair_filename, geometry)
+            native_labels = None
+
+        progress("saving", 0.8)
+        segmentation = np.argmax(prediction, axis=-1).astype(np.uint8)
 
-@router.post("/api/mri/predict")
-async def predict_mri(t1ce_filename: str = Body(...), flair_filename: str = Body(...)):
-    try:
-        # Use the predictByPath function
-        prediction = predictByPath(t1ce_filename, flair_filename)
-        save_nifti(np.transpose(prediction[:,:,:,1], (1, 2, 0)), "./one.nii.gz")
-        save_nifti(np.transpose(prediction[:,:,:,2], (1, 2, 0)), "./two.nii.gz")
-        save_nifti(np.transpose(prediction[:,:,:,3], (1, 2, 0)), "./three.nii.gz")
-        segmentation = np.argmax(prediction, axis=-1)
-        
         # Save segmentation output
-        output_path = os.path.join(PATIENT_DATA_DIR, "segmentation_output.nii.gz")
-        save_nifti(np.transpose(segmentation, (1, 2, 0)), output_path)
-        
-        # Load T1CE file for details
-        nifti_image = nib.load(f"../backend/patient_data/mri_scans/user/{t1ce_filename}")
-        mri_details = extract_mri_details(nifti_image)
-        prediction_details = extract_prediction_details(segmentation)
-
-        report = {
-            "mri_details": mri_details,
-            "prediction_details": prediction_details,
-            "segmentation_file": output_path,
-            "t1ce_file": t1ce_filename,
-        }
-
-        report_path = os.path.join(PATIENT_DATA_DIR, "mri_report.json")
-        with open(report_path, "w") as json_file:
+        labels = np.transpose(segmentation, (1, 2, 0))
+        save_label_map(labels, workspace, SEGMENTATION_FILE, geometry)
+        if native_labels is None:
+            save_native_label_map(geometry.upsample_labels(labels), workspace, NATIVE_SEGMENTATION_FILE, geometry)
+        else:
+            save_native_label_map(native_labels, workspace, NATIVE_SEGMENTATION_FILE, geometry)
+        if probability_maps != "none":
+            probability_file = save_probability_maps(prediction, workspace, probability_maps, geometry)
+
+        mri_details = header_details(source_header)
+        if native_labels is None:
+            prediction_details = extract_prediction_details(labels, geometry.zooms, geometry.affine)
+        else:
+            prediction_details = extract_prediction_details(
+                native_labels, source_header.get_zooms()[:3], geometry.source_affine,
+            )
+
+        if result_cache:
+            result_cache.put(
+                cache_key,
+                segmentation,
+                prediction,
+                {"mri_details": mri_details, "prediction_details": prediction_details, "foreground_extent": extent},
+                {name: workspace.path(name)
+                 for name in (RESIZED_T1CE_FILE, RESIZED_FLAIR_FILE, SEGMENTATION_FILE, NATIVE_SEGMENTATION_FILE)},
+            )
+
+    if probability_file is None:
+        # Maps left by an earlier run would no longer match this segmentation
+        try:
+            os.remove(workspace.path(PROBABILITY_FILE))
+        except FileNotFoundError:
+            pass
+
+    report = {
+        "mri_details": mri_details,
+        "prediction_details": prediction_details,
+        "foreground_extent": extent,
+        "segmentation_file": output_path,
+        "t1ce_file": t1ce_filename,
+    }
+
+    report_path = workspace.path("mri_report.json")
+    with workspace.atomic_path("mri_report.json") as tmp_path:
+        with open(tmp_path, "w") as json_file:
             json.dump(report, json_file, indent=4)
+    workspace.touch()
+
+    progress("completed", 1.0)
+    return {
+        "study_id": study_id,
+        "report": report,
+        "report_file": report_path,
+        "segmentation_file": SEGMENTATION_FILE,
+        "native_segmentation_file": NATIVE_SEGMENTATION_FILE,
+        "resized_t1ce_file": RESIZED_T1CE_FILE,
+        "resized_flair_file": RESIZED_FLAIR_FILE,
+        "probability_file": probability_file,
+        "labels": SEGMENT_CLASSES,
+        "file_name": t1ce_filename,
+        "cached": restored is not None,
+    }
+
+# -----------------------
+# Prediction job routes
+# -----------------------
+def check_probability_format(probability_maps):
+    if probability_maps not in PROBABILITY_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"probability_maps must be one of: {', '.join(PROBABILITY_FORMATS)}",
+        )
+
+def check_inference_mode(inference_mode):
+    if inference_mode not in INFERENCE_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"inference_mode must be one of: {', '.join(INFERENCE_MODES)}",
+        )
 
-        return {
-            "report": FileResponse(path=report_path, filename="mri_report.json", media_type="application/json"),
-            "segmentation_file": "segmentation_output.nii.gz",
-            "file_name": t1ce_filename,
-        }
+async def cached_prediction(t1ce_filename, flair_filename, study_id, probability_maps, inference_mode):
+    """
+    Serves a repeat study from the result cache in the API process, so it
+    does not wait behind inferences already queued on the workers. Returns
+    None on a miss, or when the lookup fails; the job then runs, and reports
+    any error, as usual.
+    """
+    if result_cache is None:
+        return None
+    try:
+        return await asyncio.to_thread(
+            run_prediction, t1ce_filename, flair_filename, study_id=study_id,
+            probability_maps=probability_maps, inference_mode=inference_mode, cache_only=True,
+        )
+    except Exception:
+        return None
+
+@router.post("/api/mri/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_mri_job(
+    t1ce_filename: str = Body(...),
+    flair_filename: str = Body(...),
+    study_id: str = Body(DEFAULT_STUDY_ID),
+    probability_maps: str = Body("none"),
+    inference_mode: str = Body("resample"),
+):
+    get_workspace(study_id)
+    check_probability_format(probability_maps)
+    check_inference_mode(inference_mode)
+    result = await cached_prediction(t1ce_filename, flair_filename, study_id, probability_maps, inference_mode)
+    if result is not None:
+        job_id = job_manager.add_completed(result, t1ce_filename, flair_filename, study_id)
+        return job_manager.get_status(job_id)
+    job_id = job_manager.submit(
+        t1ce_filename, flair_filename, study_id, probability_maps=probability_maps, inference_mode=inference_mode,
+    )
+    return job_manager.get_status(job_id)
+
+@router.get("/api/mri/jobs/{job_id}")
+async def get_mri_job(job_id: str):
+    job = job_manager.get_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/api/mri/jobs/{job_id}/result")
+async def get_mri_job_result(job_id: str):
+    job = job_manager.get_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Error during prediction: {job['error']}")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job_manager.get_result(job_id)
+
+@router.post("/api/mri/predict")
+async def predict_mri(
+    t1ce_filename: str = Body(...),
+    flair_filename: str = Body(...),
+    study_id: str = Body(DEFAULT_STUDY_ID),
+    probability_maps: str = Body("none"),
+    inference_mode: str = Body("resample"),
+):
+    # Same pipeline as /api/mri/jobs, but waits for the result without blocking the event loop
+    get_workspace(study_id)
+    check_probability_format(probability_maps)
+    check_inference_mode(inference_mode)
+    result = await cached_prediction(t1ce_filename, flair_filename, study_id, probability_maps, inference_mode)
+    if result is not None:
+        return result
+    job_id = job_manager.submit(
+        t1ce_filename, flair_filename, study_id, probability_maps=probability_maps, inference_mode=inference_mode,
+    )
+    try:
+        return await asyncio.wrap_future(job_manager.get_future(job_id))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during prediction: {str(e)}")
@@ -0,0 +1,134 @@
+"""
+Inference backends for the segmentation model.
+
+Every backend exposes `predict(batch)` on a float32 (N, 128, 128, 2) batch
+and returns the (N, 128, 128, 4) class probabilities, so the batcher and
+the pipeline do not care which runtime executes the network. The backend is
+chosen with SEGMENTATION_BACKEND:
+
+    keras  the original Keras model at MODEL_PATH (TensorFlow, CPU)
+    onnx   an export of the same model (see VisionModel/export_onnx.py)
+           run by ONNX Runtime's CPU execution provider
+    tflite a TensorFlow Lite conversion, e.g. the float16 / int8 variants
+           from VisionModel/quantize.py, run with the XNNPACK CPU delegate
+
+INFERENCE_THREADS / INFERENCE_INTER_OP_THREADS cap the runtime's thread
+pools; 0 leaves the runtime default. When several worker processes share a
+node, set them so workers x threads roughly matches the core count.
+"""
+import os
+import threading
+import numpy as np
+
+SEGMENTATION_BACKEND = os.getenv("SEGMENTATION_BACKEND", "keras")
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH")
+TFLITE_MODEL_PATH = os.getenv("TFLITE_MODEL_PATH")
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))
+INFERENCE_INTER_OP_THREADS = int(os.getenv("INFERENCE_INTER_OP_THREADS", "0"))
+
+class InferenceBackend:
+    name = None
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+class KerasBackend(InferenceBackend):
+    name = "keras"
+
+    def __init__(self, model_path, custom_objects=None, threads=INFERENCE_THREADS, inter_op_threads=INFERENCE_INTER_OP_THREADS):
+        super().__init__(model_path)
+        import tensorflow as tf
+        from tensorflow import keras
+        try:
+            if threads:
+                tf.config.threading.set_intra_op_parallelism_threads(threads)
+            if inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        except RuntimeError:
+            # TensorFlow was already initialised in this process; keep its pools
+            pass
+        self.model = keras.models.load_model(model_path, custom_objects=custom_objects, compile=False)
+
+    def predict(self, batch):
+        return self.model.predict(batch, batch_size=len(batch), verbose=0)
+
+class OnnxBackend(InferenceBackend):
+    name = "onnx"
+
+    def __init__(self, model_path, threads=INFERENCE_THREADS, inter_op_threads=INFERENCE_INTER_OP_THREADS):
+        super().__init__(model_path)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("SEGMENTATION_BACKEND=onnx requires the onnxruntime package")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = inter_op_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+class TFLiteBackend(InferenceBackend):
+    name = "tflite"
+
+    def __init__(self, model_path, threads=INFERENCE_THREADS, inter_op_threads=INFERENCE_INTER_OP_THREADS):
+        super().__init__(model_path)
+        import tensorflow as tf
+        # Float and dynamic-range models get the XNNPACK delegate by default
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=threads or None)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        # An interpreter holds its tensors in place and cannot be shared between threads
+        self._lock = threading.Lock()
+
+    def predict(self, batch):
+        with self._lock:
+            if len(batch) != self._batch_size:
+                shape = (len(batch),) + tuple(self.input["shape"][1:])
+                self.interpreter.resize_tensor_input(self.input["index"], shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self.interpreter.set_tensor(self.input["index"], _quantize(batch, self.input))
+            self.interpreter.invoke()
+            return _dequantize(self.interpreter.get_tensor(self.output["index"]), self.output)
+
+def _quantize(batch, details):
+    if details["dtype"] == np.float32:
+        return np.ascontiguousarray(batch, dtype=np.float32)
+    scale, zero_point = details["quantization"]
+    info = np.iinfo(details["dtype"])
+    return np.clip(np.rint(batch / scale + zero_point), info.min, info.max).astype(details["dtype"])
+
+def _dequantize(output, details):
+    if output.dtype == np.float32:
+        return output
+    scale, zero_point = details["quantization"]
+    return (output.astype(np.float32) - zero_point) * scale
+
+def active_model_path(name=SEGMENTATION_BACKEND):
+    """Model file the selected backend serves, without loading it."""
+    return {"keras": os.getenv("MODEL_PATH"), "onnx": ONNX_MODEL_PATH, "tflite": TFLITE_MODEL_PATH}.get(name)
+
+def create_backend(name=SEGMENTATION_BACKEND, keras_model_path=None, custom_objects=None, **options):
+    if name == "keras":
+        if custom_objects is None:
+            # metrics imports Keras, so only the Keras backend pays for TensorFlow
+            from VisionModel.metrics import custom_objects
+        return KerasBackend(keras_model_path, custom_objects=custom_objects, **options)
+    if name == "onnx":
+        if not ONNX_MODEL_PATH:
+            raise RuntimeError("SEGMENTATION_BACKEND=onnx requires ONNX_MODEL_PATH")
+        return OnnxBackend(ONNX_MODEL_PATH, **options)
+    if name == "tflite":
+        if not TFLITE_MODEL_PATH:
+            raise RuntimeError("SEGMENTATION_BACKEND=tflite requires TFLITE_MODEL_PATH")
+        return TFLiteBackend(TFLITE_MODEL_PATH, **options)
+    raise ValueError(f"Unknown SEGMENTATION_BACKEND: {name}")
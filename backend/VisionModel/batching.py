@@ -0,0 +1,114 @@
+"""
+Cross-request micro-batching for the segmentation model.
+
+Each study is a stack of independent 2-D slices, so slices from concurrent
+requests can share one forward pass. Callers hand a whole volume to
+`MicroBatcher.predict`; a scheduler thread packs pending slices into batches
+of up to `max_batch_size`, waiting at most `max_wait_ms` for a batch to fill,
+and hands every caller back exactly its own rows.
+
+Batches only form across studies that are in flight at the same time in
+one process, so merging needs MRI_WORKER_MODE=thread and MRI_WORKERS > 1.
+With the defaults (process mode, one worker) each worker process has its
+own batcher and runs one study at a time, so every forward pass carries a
+single study's slices; MRI_BATCH_SIZE then only sets the chunk size.
+
+The MRI_BATCH_WAIT_MS window is only spent while more than one caller is
+queued, so a lone study's trailing partial batches run straight away.
+"""
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+
+MRI_BATCH_SIZE = int(os.getenv("MRI_BATCH_SIZE", "64"))
+MRI_BATCH_WAIT_MS = float(os.getenv("MRI_BATCH_WAIT_MS", "10"))
+
+class _PendingVolume:
+    def __init__(self, x):
+        self.x = x
+        self.taken = 0  # slices already scheduled into a batch
+        self.outputs = []
+        self.received = 0  # slices already predicted
+        self.future = Future()
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=MRI_BATCH_SIZE, max_wait_ms=MRI_BATCH_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def predict(self, x):
+        """Blocks until the model output for every slice in `x` is available."""
+        if len(x) == 0:
+            return self.predict_fn(x)
+        volume = _PendingVolume(x)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._pending.append(volume)
+            self._cond.notify()
+        return volume.future.result()
+
+    def _queued_slices(self):
+        return sum(len(v.x) - v.taken for v in self._pending)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Give other requests a short window to join a partly filled batch,
+            # but only while another caller is queued; a lone caller never waits
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) > 1 and self._queued_slices() < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            parts = []
+            budget = self.max_batch_size
+            while self._pending and budget > 0:
+                volume = self._pending[0]
+                count = min(budget, len(volume.x) - volume.taken)
+                parts.append((volume, volume.taken, count))
+                volume.taken += count
+                budget -= count
+                if volume.taken == len(volume.x):
+                    self._pending.popleft()
+            return parts
+
+    def _run(self):
+        while True:
+            parts = self._next_batch()
+            if len(parts) == 1:
+                volume, start, count = parts[0]
+                batch = volume.x[start:start + count]
+            else:
+                batch = np.concatenate([v.x[s:s + c] for v, s, c in parts])
+
+            try:
+                output = self.predict_fn(batch)
+            except Exception as e:
+                with self._cond:
+                    for volume, _, _ in parts:
+                        if volume in self._pending:
+                            self._pending.remove(volume)
+                for volume, _, _ in parts:
+                    if not volume.future.done():
+                        volume.future.set_exception(e)
+                continue
+
+            offset = 0
+            for volume, _, count in parts:
+                volume.outputs.append(output[offset:offset + count])
+                volume.received += count
+                offset += count
+                if volume.received == len(volume.x) and not volume.future.done():
+                    volume.future.set_result(np.concatenate(volume.outputs))
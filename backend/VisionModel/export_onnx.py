@@ -0,0 +1,90 @@
+"""
+Exports the Keras segmentation model to ONNX and checks the export against
+the Keras outputs on a sample study.
+
+Run from the backend directory (needs tf2onnx and onnxruntime):
+    python -m VisionModel.export_onnx --output models/segmentation.onnx
+    python -m VisionModel.export_onnx --output models/segmentation.onnx --check-only
+
+The parity check fails (non-zero exit) when the probabilities differ by more
+than --atol or any label disagrees in more than --max-label-mismatch of the
+voxels, and prints the throughput of both backends.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from VisionModel.preprocessing import build_model_input, foreground_extent
+
+load_dotenv()
+os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+
+SAMPLE_FLAIR = "./patient_data/test_scan/test_flair.nii.gz"
+SAMPLE_T1CE = "./patient_data/test_scan/test_t1ce.nii.gz"
+
+def export(keras_backend, output_path, opset=17):
+    import tensorflow as tf
+    try:
+        import tf2onnx
+    except ImportError:
+        sys.exit("Exporting requires tf2onnx: pip install tf2onnx")
+    spec = (tf.TensorSpec((None,) + tuple(keras_backend.model.input_shape[1:]), tf.float32, name="input"),)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tf2onnx.convert.from_keras(keras_backend.model, input_signature=spec, opset=opset, output_path=output_path)
+
+def sample_batch(flair_path=SAMPLE_FLAIR, t1ce_path=SAMPLE_T1CE):
+    X = build_model_input(flair_path, t1ce_path)
+    start, stop = foreground_extent(X)["z"]
+    X = X[start:stop]
+    X /= np.max(X)
+    return X
+
+def throughput(backend, batch, repeats=3):
+    backend.predict(batch[:8])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        output = backend.predict(batch)
+    elapsed = (time.perf_counter() - start) / repeats
+    return output, len(batch) / elapsed
+
+def check_parity(reference_backend, candidate_backend, batch):
+    """Compares two backends on `batch`; returns the statistics the CLI prints."""
+    reference, reference_rate = throughput(reference_backend, batch)
+    candidate, candidate_rate = throughput(candidate_backend, batch)
+    return {
+        "max_abs_diff": float(np.max(np.abs(reference - candidate))),
+        "label_mismatch": float(np.mean(np.argmax(reference, -1) != np.argmax(candidate, -1))),
+        "reference_slices_per_s": reference_rate,
+        "candidate_slices_per_s": candidate_rate,
+    }
+
+def main():
+    from VisionModel.backends import KerasBackend, OnnxBackend
+    from VisionModel.metrics import custom_objects
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default=os.getenv("ONNX_MODEL_PATH", "segmentation.onnx"))
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--check-only", action="store_true")
+    parser.add_argument("--atol", type=float, default=1e-4)
+    parser.add_argument("--max-label-mismatch", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    keras_backend = KerasBackend(os.getenv("MODEL_PATH"), custom_objects=custom_objects)
+    if not args.check_only:
+        export(keras_backend, args.output, args.opset)
+        print(f"Exported ONNX model to {args.output}")
+
+    stats = check_parity(keras_backend, OnnxBackend(args.output), sample_batch())
+    print(f"max |p_keras - p_onnx| : {stats['max_abs_diff']:.2e}")
+    print(f"label mismatch         : {stats['label_mismatch'] * 100:.4f}% of voxels")
+    print(f"keras throughput       : {stats['reference_slices_per_s']:.1f} slices/s")
+    print(f"onnx throughput        : {stats['candidate_slices_per_s']:.1f} slices/s")
+    if stats["max_abs_diff"] > args.atol or stats["label_mismatch"] > args.max_label_mismatch:
+        sys.exit("Parity check FAILED")
+    print("Parity check passed")
+
+if __name__ == "__main__":
+    main()
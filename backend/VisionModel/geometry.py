@@ -0,0 +1,69 @@
+"""
+Geometry bookkeeping between the native scan grid and the model grid.
+
+The model sees every slice resized in-plane to IMG_SIZE x IMG_SIZE. A
+`ResampledGeometry` carries the source affine and header through that
+resize, so saved outputs line up with the input scan in any viewer. It can
+also map label volumes back to the native grid with nearest-neighbour
+lookup, which keeps labels exact instead of blurring them like a cubic zoom.
+"""
+import numpy as np
+import nibabel as nib
+
+class ResampledGeometry:
+    def __init__(self, source_header, size, start=0, depth=None):
+        """
+        `source_header` is the NIfTI header of the volume the model input was
+        read from; `size` is the (rows, cols) in-plane model grid and
+        `start`/`depth` select the slab of slices fed to the model.
+        """
+        self.source_affine = source_header.get_best_affine()
+        self.source_header = source_header.copy()
+        self.source_shape = tuple(int(d) for d in source_header.get_data_shape()[:3])
+        depth = self.source_shape[2] - start if depth is None else depth
+        self.shape = (int(size[0]), int(size[1]), depth)
+
+        # cv2.resize samples source position (i + 0.5) * scale - 0.5 for output index i
+        scale_i = self.source_shape[0] / self.shape[0]
+        scale_j = self.source_shape[1] / self.shape[1]
+        voxel_to_source = np.array([
+            [scale_i, 0, 0, 0.5 * scale_i - 0.5],
+            [0, scale_j, 0, 0.5 * scale_j - 0.5],
+            [0, 0, 1, start],
+            [0, 0, 0, 1],
+        ])
+        self.affine = self.source_affine @ voxel_to_source
+        source_zooms = self.source_header.get_zooms()[:3]
+        self.zooms = (source_zooms[0] * scale_i, source_zooms[1] * scale_j, source_zooms[2])
+        self._start = start
+
+    def image(self, data):
+        """Wraps data on the model grid (x, y, z[, c]) in a NIfTI image with the resampled geometry."""
+        img = nib.Nifti1Image(data, self.affine)
+        img.header.set_xyzt_units(*self.source_header.get_xyzt_units())
+        img.header.set_zooms(self.zooms + tuple(img.header.get_zooms()[3:]))
+        return img
+
+    def native_image(self, data):
+        """Wraps data on the native grid in a NIfTI image with the source affine and header."""
+        header = self.source_header.copy()
+        header.set_data_dtype(data.dtype)
+        header.set_slope_inter(None, None)
+        return nib.Nifti1Image(data, self.source_affine, header)
+
+    def upsample_labels(self, labels):
+        """
+        Nearest-neighbour resize of an (x, y, z) label volume on the model grid
+        to the native grid, done with one fancy-indexing gather. Slices outside
+        the model slab are background.
+        """
+        rows = _nearest_indices(self.source_shape[0], self.shape[0])
+        cols = _nearest_indices(self.source_shape[1], self.shape[1])
+        native = np.zeros(self.source_shape, dtype=labels.dtype)
+        native[:, :, self._start:self._start + labels.shape[2]] = labels[np.ix_(rows, cols)]
+        return native
+
+def _nearest_indices(target, source):
+    """For each of `target` output pixels, the index of the nearest of `source` input pixels."""
+    centers = (np.arange(target) + 0.5) * (source / target)
+    return np.minimum(centers.astype(np.intp), source - 1)
@@ -0,0 +1,238 @@
+"""
+Background job queue for MRI segmentation.
+
+Predictions run in a pool of worker processes, each holding its own copy of
+the Keras model, so the uvicorn event loop never waits on inference. Workers
+report stage changes back through a queue that a listener thread folds into
+the job table.
+
+With MRI_WORKER_MODE=thread the jobs run on threads of the API process
+instead and share its single model, so slices from concurrent studies are
+merged into common batches by `VisionModel.batching.MicroBatcher`.
+"""
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from VisionModel.storage import DEFAULT_STUDY_ID
+
+MRI_WORKERS = int(os.getenv("MRI_WORKERS", "1"))
+MRI_WORKER_MODE = os.getenv("MRI_WORKER_MODE", "process")
+JOB_RETENTION_SECONDS = int(os.getenv("MRI_JOB_RETENTION_SECONDS", "3600"))
+WORKER_START_TIMEOUT = float(os.getenv("MRI_WORKER_START_TIMEOUT_SECONDS", "600"))
+
+# -----------------------
+# Worker process side
+# -----------------------
+_progress_queue = None
+_ready_barrier = None
+
+def _init_worker(progress_queue, ready_barrier):
+    global _progress_queue, _ready_barrier
+    _progress_queue = progress_queue
+    _ready_barrier = ready_barrier
+    # Each worker loads its own copy of the model before taking jobs
+    from VisionModel.ai_model import segmentation_model
+    segmentation_model.get()
+
+def _worker_ready():
+    # Holding the task until every worker has one stops a fast worker from
+    # answering for the ones still loading their model
+    _ready_barrier.wait(timeout=WORKER_START_TIMEOUT)
+    return os.getpid()
+
+def _run_job(job_id, t1ce_filename, flair_filename, study_id, options):
+    from VisionModel.ai_model import run_prediction
+
+    def progress(stage, fraction):
+        _progress_queue.put((job_id, stage, fraction))
+
+    return run_prediction(t1ce_filename, flair_filename, progress=progress, study_id=study_id, **options)
+
+# -----------------------
+# API process side
+# -----------------------
+class JobManager:
+    def __init__(self, max_workers=MRI_WORKERS, mode=MRI_WORKER_MODE):
+        if mode not in ("process", "thread"):
+            raise ValueError(f"Unknown MRI_WORKER_MODE: {mode}")
+        self.max_workers = max(1, max_workers)
+        self.mode = mode
+        self._jobs = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        # Guards pool creation, which the warm-up thread and requests may race on
+        self._pool_lock = threading.Lock()
+        self._executor = None
+
+    def _ensure_pool(self):
+        with self._pool_lock:
+            if self._executor is None and self.mode == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mri-job")
+            # TensorFlow is not fork-safe, so worker processes are always spawned
+            if self._executor is None:
+                ctx = multiprocessing.get_context("spawn")
+                progress_queue = ctx.Queue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=ctx,
+                    initializer=_init_worker,
+                    initargs=(progress_queue, ctx.Barrier(self.max_workers)),
+                )
+                threading.Thread(target=self._listen, args=(progress_queue,), daemon=True).start()
+            return self._executor
+
+    def _discard_pool(self, executor):
+        """Drops a broken pool so the next `_ensure_pool` builds a fresh one."""
+        with self._pool_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args):
+        executor = self._ensure_pool()
+        try:
+            return executor.submit(fn, *args)
+        except BrokenExecutor:
+            # A worker died (e.g. OOM-killed) and took the pool with it; rebuild once
+            self._discard_pool(executor)
+            return self._ensure_pool().submit(fn, *args)
+
+    def _listen(self, progress_queue):
+        while True:
+            self._update_progress(*progress_queue.get())
+
+    def _update_progress(self, job_id, stage, fraction):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in ("completed", "failed"):
+                return
+            if job["status"] == "queued":
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            job["stage"] = stage
+            job["progress"] = fraction
+
+    def _run_in_thread(self, job_id, t1ce_filename, flair_filename, study_id, options):
+        from VisionModel.ai_model import run_prediction
+
+        def progress(stage, fraction):
+            self._update_progress(job_id, stage, fraction)
+
+        return run_prediction(t1ce_filename, flair_filename, progress=progress, study_id=study_id, **options)
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["finished_at"] = time.time()
+            job["progress"] = 1.0
+            if future.exception() is not None:
+                job["status"] = "failed"
+                job["stage"] = "failed"
+                job["error"] = str(future.exception())
+            else:
+                job["status"] = "completed"
+                job["stage"] = "completed"
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id, job in list(self._jobs.items()):
+            if job["finished_at"] is not None and job["finished_at"] < cutoff:
+                del self._jobs[job_id]
+                del self._futures[job_id]
+
+    def submit(self, t1ce_filename, flair_filename, study_id=DEFAULT_STUDY_ID, **options):
+        """`options` are passed through to `run_prediction` as keyword arguments."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "stage": "queued",
+                "progress": 0.0,
+                "error": None,
+                "study_id": study_id,
+                "t1ce_filename": t1ce_filename,
+                "flair_filename": flair_filename,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            }
+        run = self._run_in_thread if self.mode == "thread" else _run_job
+        try:
+            future = self._submit(run, job_id, t1ce_filename, flair_filename, study_id, options)
+        except Exception:
+            # Never leave a job reported as queued that no worker will run
+            with self._lock:
+                del self._jobs[job_id]
+            raise
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def add_completed(self, result, t1ce_filename, flair_filename, study_id=DEFAULT_STUDY_ID):
+        """Records a job whose result is already known (e.g. a cache hit), without queueing it."""
+        job_id = uuid.uuid4().hex
+        future = Future()
+        future.set_result(result)
+        now = time.time()
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "completed",
+                "stage": "completed",
+                "progress": 1.0,
+                "error": None,
+                "study_id": study_id,
+                "t1ce_filename": t1ce_filename,
+                "flair_filename": flair_filename,
+                "submitted_at": now,
+                "started_at": now,
+                "finished_at": now,
+            }
+            self._futures[job_id] = future
+        return job_id
+
+    def start_workers(self):
+        """
+        Starts every worker process and blocks until each has loaded and
+        warmed its model. In thread mode the pool shares the API process's
+        model, so there is nothing to start.
+
+        Each worker's task waits on a barrier sized to the pool, so the call
+        returns only once `max_workers` distinct processes are up; a worker
+        that fails to start within MRI_WORKER_START_TIMEOUT_SECONDS breaks
+        the barrier and this raises.
+        """
+        if self.mode == "thread":
+            self._ensure_pool()
+            return []
+        futures = [self._submit(_worker_ready) for _ in range(self.max_workers)]
+        return sorted({future.result() for future in futures})
+
+    def get_status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def get_future(self, job_id):
+        with self._lock:
+            return self._futures.get(job_id)
+
+    def get_result(self, job_id):
+        future = self.get_future(job_id)
+        if future is None or not future.done():
+            return None
+        return future.result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+job_manager = JobManager()
@@ -0,0 +1,42 @@
+"""
+Header-only NIfTI metadata.
+
+Only the fixed-size header is read (for .nii.gz, only the first few hundred
+bytes of the stream are inflated), so study information is available without
+touching voxel data. Parsed headers are cached per file and invalidated when
+the file's size or mtime changes.
+"""
+import os
+import gzip
+from functools import lru_cache
+import nibabel as nib
+
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", "1024"))
+
+@lru_cache(maxsize=METADATA_CACHE_SIZE)
+def _load_header(path, mtime_ns, size):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return nib.Nifti1Header.from_fileobj(f)
+
+def read_header(path):
+    """Parsed NIfTI-1 header of `path`; callers get a copy they are free to modify."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return _load_header(path, stat.st_mtime_ns, stat.st_size).copy()
+
+def header_details(header):
+    zooms = header.get_zooms()
+    details = {
+        "dimensions": [int(dim) for dim in header.get_data_shape()],
+        "voxel_size": [float(vx) for vx in zooms],
+        "slice_thickness": f"{float(zooms[2])}mm",
+        "data_type": str(header.get_data_dtype())
+    }
+    description = header["descrip"].item().decode("utf-8", errors="replace").strip("\x00 ")
+    if description:
+        details["description"] = description
+    return details
+
+def volume_details(path):
+    return header_details(read_header(path))
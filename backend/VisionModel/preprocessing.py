@@ -0,0 +1,94 @@
+"""
+Volume preprocessing shared by the segmentation pipeline.
+
+Kept free of TensorFlow so it can be imported by tools and benchmarks
+without loading the model.
+"""
+import os
+import gzip
+import uuid
+import shutil
+import cv2
+import nibabel as nib
+import numpy as np
+
+def working_copy(path):
+    """
+    Uncompressed twin of a .nii.gz file, created next to it on first use.
+    Decompressing once lets every later read memory-map the file instead of
+    inflating the whole volume again.
+    """
+    if not path.endswith(".nii.gz"):
+        return path
+    nii_path = path[:-len(".gz")]
+    if not os.path.exists(nii_path) or os.path.getmtime(nii_path) < os.path.getmtime(path):
+        tmp_path = f"{nii_path}.tmp-{uuid.uuid4().hex}"
+        try:
+            with gzip.open(path, "rb") as src, open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(tmp_path, nii_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return nii_path
+
+def load_volume(path):
+    """Voxel data of a NIfTI volume, memory-mapped in its on-disk dtype when the file carries no scaling."""
+    return np.asanyarray(nib.load(working_copy(path), mmap=True).dataobj)
+
+# Channels per cv2.resize call. OpenCV 5 rejects images with more than 128
+# channels and INTER_AREA asserts cn <= 4 for non-integer scales, so stacks
+# are resized four slices at a time, which every version and kernel accepts.
+CV_RESIZE_CHANNELS = 4
+
+def resize_stack(stack, width, height, interpolation=cv2.INTER_LINEAR):
+    """
+    Resizes an (H, W, N) float32 stack to (height, width, N), treating the
+    slices as cv2 channels in chunks of CV_RESIZE_CHANNELS.
+    """
+    count = stack.shape[2]
+    out = np.empty((height, width, count), dtype=np.float32)
+    for start in range(0, count, CV_RESIZE_CHANNELS):
+        chunk = np.ascontiguousarray(stack[:, :, start:start + CV_RESIZE_CHANNELS])
+        resized = cv2.resize(chunk, (width, height), interpolation=interpolation)
+        # A single-channel chunk comes back without its channel axis
+        out[:, :, start:start + chunk.shape[2]] = resized.reshape(height, width, chunk.shape[2])
+    return out
+
+def resample_volume(volume, out, start=0):
+    """
+    Resizes slices `start:start + len(out)` of an (H, W, D) volume into `out`,
+    an (N, size, size) view of the model input buffer, with the same
+    bilinear kernel the per-slice loop used.
+    """
+    count, height, width = out.shape
+    stack = volume[:, :, start:start + count]
+    if stack.dtype != np.float32:
+        stack = stack.astype(np.float32)
+    out[...] = resize_stack(stack, width, height).transpose(2, 0, 1)
+    return out
+
+def build_model_input(flair_path, t1ce_path, size=128, depth=155, start=0):
+    """Resampled, un-normalised (depth, size, size, 2) FLAIR/T1CE model input."""
+    X = np.empty((depth, size, size, 2), dtype=np.float32)
+    for channel, path in enumerate((flair_path, t1ce_path)):
+        resample_volume(load_volume(path), X[:, :, :, channel], start=start)
+    return X
+
+def foreground_extent(X):
+    """
+    Half-open (x, y, z) ranges covering every non-zero voxel of an
+    (N, H, W, C) model input, where z indexes the N slices. Returns None
+    for an empty volume.
+    """
+    mask = np.any(X != 0, axis=-1)
+    slices = np.flatnonzero(mask.any(axis=(1, 2)))
+    if len(slices) == 0:
+        return None
+    rows = np.flatnonzero(mask.any(axis=(0, 2)))
+    cols = np.flatnonzero(mask.any(axis=(0, 1)))
+    return {
+        "x": [int(rows[0]), int(rows[-1]) + 1],
+        "y": [int(cols[0]), int(cols[-1]) + 1],
+        "z": [int(slices[0]), int(slices[-1]) + 1],
+    }
@@ -0,0 +1,151 @@
+"""
+Builds post-training quantized TFLite variants of the segmentation model and
+reports how they compare with the float Keras model.
+
+Run from the backend directory:
+    python -m VisionModel.quantize --output-dir models/quantized
+
+Variants:
+    float16  weights stored as float16, computed in float32
+    int8     full-integer weights and activations, calibrated on the
+             non-empty slices of the sample studies; input/output stay float32
+
+Any variant can be served with SEGMENTATION_BACKEND=tflite and
+TFLITE_MODEL_PATH pointing at the produced .tflite file. The report scores
+each variant against the float model's labels with the training metrics
+(dice_coef_necrotic / edema / enhancing) and lists per-volume latency, model
+size and the resident memory added by loading it.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from VisionModel.preprocessing import build_model_input, foreground_extent
+
+load_dotenv()
+os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+
+CALIBRATION_STUDIES = [
+    ("./patient_data/test_scan/test_flair.nii.gz", "./patient_data/test_scan/test_t1ce.nii.gz"),
+]
+
+def load_studies(studies):
+    batches = []
+    for flair_path, t1ce_path in studies:
+        X = build_model_input(flair_path, t1ce_path)
+        extent = foreground_extent(X)
+        if extent is None:
+            continue
+        start, stop = extent["z"]
+        X = X[start:stop]
+        X /= np.max(X)
+        batches.append(X)
+    if not batches:
+        sys.exit("No non-empty calibration volumes found")
+    return batches
+
+def convert(keras_model, variant, calibration):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        def representative_dataset():
+            for X in calibration:
+                for i in range(len(X)):
+                    yield [X[i:i + 1]]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError(f"Unknown variant: {variant}")
+    return converter.convert()
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def _size_mb(path):
+    if os.path.isdir(path):
+        total = sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+    else:
+        total = os.path.getsize(path)
+    return round(total / 2**20, 1)
+
+def _one_hot(probabilities):
+    return np.eye(probabilities.shape[-1], dtype=np.float32)[np.argmax(probabilities, axis=-1)]
+
+def evaluate(backend, volumes, reference_labels=None, repeats=3):
+    from VisionModel.metrics import dice_coef_necrotic, dice_coef_edema, dice_coef_enhancing
+
+    backend.predict(volumes[0][:8])  # warm-up
+    latencies, outputs = [], []
+    for X in volumes:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            output = backend.predict(X)
+        latencies.append((time.perf_counter() - start) / repeats)
+        outputs.append(_one_hot(output))
+
+    result = {"latency_ms_per_volume": round(float(np.mean(latencies)) * 1000, 1)}
+    if reference_labels is not None:
+        y_true = np.concatenate(reference_labels)
+        y_pred = np.concatenate(outputs)
+        result["dice"] = {
+            name: round(float(metric(y_true, y_pred)), 4)
+            for name, metric in (
+                ("necrotic", dice_coef_necrotic),
+                ("edema", dice_coef_edema),
+                ("enhancing", dice_coef_enhancing),
+            )
+        }
+    return result, outputs
+
+def main():
+    from VisionModel.backends import KerasBackend, TFLiteBackend
+    from VisionModel.metrics import custom_objects
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output-dir", default="models/quantized")
+    parser.add_argument("--variants", nargs="+", default=["float16", "int8"])
+    args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    volumes = load_studies(CALIBRATION_STUDIES)
+    model_path = os.getenv("MODEL_PATH")
+
+    rss_before = _rss_mb()
+    keras_backend = KerasBackend(model_path, custom_objects=custom_objects)
+    report = {"float32 (keras)": {"model_mb": _size_mb(model_path),
+                                  "load_rss_mb": round(_rss_mb() - rss_before, 1)}}
+    stats, reference_labels = evaluate(keras_backend, volumes)
+    report["float32 (keras)"].update(stats)
+
+    for variant in args.variants:
+        path = os.path.join(args.output_dir, f"segmentation_{variant}.tflite")
+        with open(path, "wb") as f:
+            f.write(convert(keras_backend.model, variant, volumes))
+        rss_before = _rss_mb()
+        backend = TFLiteBackend(path)
+        report[variant] = {"path": path,
+                           "model_mb": _size_mb(path),
+                           "load_rss_mb": round(_rss_mb() - rss_before, 1)}
+        stats, _ = evaluate(backend, volumes, reference_labels)
+        report[variant].update(stats)
+
+    report_path = os.path.join(args.output_dir, "quantization_report.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=4)
+
+    print(f"{'variant':<18}{'size MB':>9}{'load MB':>9}{'ms/vol':>9}  dice (necrotic / edema / enhancing)")
+    for name, row in report.items():
+        dice = row.get("dice")
+        dice_text = " / ".join(f"{v:.4f}" for v in dice.values()) if dice else "reference"
+        print(f"{name:<18}{row['model_mb']:>9}{row['load_rss_mb']:>9}{row['latency_ms_per_volume']:>9}  {dice_text}")
+    print(f"Report written to {report_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Content-addressed cache of segmentation results.
+
+Entries are keyed on a SHA-256 over both input volumes plus the identity of
+the model file, so re-running a study that was already segmented skips
+inference and the NIfTI writes entirely. Each entry is a directory holding
+the argmax segmentation, the per-class probability maps, the prediction
+details and the NIfTI artifacts the dashboard loads; a hit links those
+artifacts into the study rather than copying them. Entries are published
+with an atomic rename and evicted least-recently-used once the cache grows
+past its size budget.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import numpy as np
+
+MRI_CACHE_ENABLED = os.getenv("MRI_CACHE_ENABLED", "1") == "1"
+MRI_CACHE_DIR = os.getenv("MRI_CACHE_DIR", "./patient_data/cache")
+MRI_CACHE_MAX_MB = int(os.getenv("MRI_CACHE_MAX_MB", "2048"))
+
+_CHUNK_SIZE = 1024 * 1024
+# Bump whenever the stored artifacts change format so stale entries miss
+CACHE_FORMAT_VERSION = "6"
+
+def file_digest(path, digest=None):
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+def model_identity(model_path):
+    """Cheap identity for a model file or SavedModel directory: path, sizes and mtimes."""
+    model_path = os.path.abspath(model_path)
+    if os.path.isdir(model_path):
+        parts = []
+        for root, _, files in sorted(os.walk(model_path)):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                parts.append(f"{os.path.relpath(os.path.join(root, name), model_path)}:{stat.st_size}:{stat.st_mtime_ns}")
+        return f"{model_path}|" + "|".join(parts)
+    stat = os.stat(model_path)
+    return f"{model_path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def _dir_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+class ResultCache:
+    def __init__(self, cache_dir=MRI_CACHE_DIR, max_bytes=MRI_CACHE_MAX_MB * 2**20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, t1ce_path, flair_path, model_id):
+        digest = hashlib.sha256()
+        digest.update(f"{CACHE_FORMAT_VERSION}\0{model_id}".encode("utf-8"))
+        for path in (t1ce_path, flair_path):
+            digest.update(b"\0")
+            file_digest(path, digest)
+        return digest.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """Returns the cached entry for `key`, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, "details.json")) as f:
+                details = json.load(f)
+            # Touching the entry marks it as recently used for eviction
+            os.utime(entry_dir)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return {
+            "dir": entry_dir,
+            "details": details,
+            "artifacts": {name: os.path.join(entry_dir, name) for name in details["artifacts"]},
+        }
+
+    def load_arrays(self, key):
+        entry_dir = self._entry_dir(key)
+        segmentation = np.load(os.path.join(entry_dir, "segmentation.npy"), mmap_mode="r")
+        probabilities = np.load(os.path.join(entry_dir, "probabilities.npy"), mmap_mode="r")
+        return segmentation, probabilities
+
+    def put(self, key, segmentation, probabilities, details, artifacts):
+        """
+        Stores one result. `artifacts` maps output file names to files already
+        written for this study; they are copied into the entry so a hit can
+        restore them without re-encoding.
+        """
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.cache_dir)
+        try:
+            np.save(os.path.join(tmp_dir, "segmentation.npy"), segmentation.astype(np.uint8))
+            np.save(os.path.join(tmp_dir, "probabilities.npy"), probabilities.astype(np.float16))
+            for name, path in artifacts.items():
+                shutil.copyfile(path, os.path.join(tmp_dir, name))
+            with open(os.path.join(tmp_dir, "details.json"), "w") as f:
+                json.dump({**details, "artifacts": sorted(artifacts), "created_at": time.time()}, f)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another worker published the same key first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        with self._evict_lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_dir() and not entry.name.startswith("."):
+                    entries.append((entry.stat().st_mtime, _dir_size(entry.path), entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def restore(self, entry, workspace):
+        """
+        Hardlinks the cached NIfTI artifacts of `entry` into a study workspace,
+        copying only when the cache sits on another filesystem. Workspace files
+        are only ever replaced, never written in place, so sharing the inode
+        cannot alter the cache entry.
+
+        Returns False when the entry was evicted after `get` (possibly by
+        another worker process); callers treat that as a miss.
+        """
+        # Keeps this process's evictions out; other processes are caught below
+        with self._evict_lock:
+            try:
+                for name, path in entry["artifacts"].items():
+                    with workspace.atomic_path(name) as tmp_path:
+                        try:
+                            os.link(path, tmp_path)
+                        except FileNotFoundError:
+                            raise
+                        except OSError:
+                            shutil.copyfile(path, tmp_path)
+            except FileNotFoundError:
+                return False
+        return True
+
+result_cache = ResultCache() if MRI_CACHE_ENABLED else None
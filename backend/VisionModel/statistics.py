@@ -0,0 +1,104 @@
+"""
+Tumor statistics for a segmentation label volume.
+
+Class voxel counts and per-slice areas each come from a single np.bincount
+pass; lesions are the 6-connected components of the whole-tumor mask, with
+their extent, centroid and class composition gathered from the same label
+image, so the whole report costs a handful of linear passes over the volume.
+"""
+import os
+import numpy as np
+from scipy import ndimage
+
+MAX_REPORTED_LESIONS = int(os.getenv("MAX_REPORTED_LESIONS", "50"))
+
+REGION_NAMES = {
+    1: "necrotic_tissue_volume",
+    2: "edema_volume",
+    3: "enhancing_tumor_volume",
+}
+
+_CONNECTIVITY = ndimage.generate_binary_structure(3, 1)
+
+def _round(values, digits=2):
+    return [round(float(v), digits) for v in values]
+
+def tumor_statistics(labels, voxel_size=(1.0, 1.0, 1.0), affine=None, num_classes=4):
+    """
+    `labels` is an (x, y, z) integer volume with 0 as background. Volumes are
+    reported in mm³ and areas in mm² using `voxel_size`; when `affine` is
+    given, lesion centroids are also reported in scanner coordinates.
+    """
+    labels = np.asarray(labels)
+    flat = labels.reshape(-1)
+    voxel_mm3 = float(np.prod(voxel_size[:3]))
+    pixel_mm2 = float(voxel_size[0] * voxel_size[1])
+
+    counts = np.bincount(flat, minlength=num_classes)[:num_classes]
+
+    # Per-slice areas: offset every slice's labels into its own bin range
+    depth = labels.shape[2]
+    slice_bins = labels.astype(np.intp) + (np.arange(depth, dtype=np.intp) * num_classes)
+    per_slice = np.bincount(slice_bins.reshape(-1), minlength=depth * num_classes)
+    per_slice = per_slice.reshape(depth, num_classes)
+
+    # Lesions: connected components of the whole-tumor mask
+    lesion_map, lesion_count = ndimage.label(labels > 0, structure=_CONNECTIVITY)
+    lesions = []
+    if lesion_count:
+        # Everything per lesion is gathered from the tumor voxels alone, which
+        # are a small fraction of the volume
+        tumor_index = np.flatnonzero(lesion_map)
+        ids = lesion_map.reshape(-1)[tumor_index]
+        sizes = np.bincount(ids, minlength=lesion_count + 1)
+        composition = np.bincount(
+            ids.astype(np.intp) * num_classes + flat[tumor_index],
+            minlength=(lesion_count + 1) * num_classes,
+        ).reshape(lesion_count + 1, num_classes)
+        # Coordinate sums per component give centroids without another label pass
+        centroid_sums = [
+            np.bincount(ids, weights=c, minlength=lesion_count + 1)
+            for c in np.unravel_index(tumor_index, labels.shape)
+        ]
+        boxes = ndimage.find_objects(lesion_map)
+
+        order = np.argsort(sizes[1:])[::-1][:MAX_REPORTED_LESIONS] + 1
+        for index in order:
+            centroid = [float(s[index] / sizes[index]) for s in centroid_sums]
+            box = boxes[index - 1]
+            lesion = {
+                "id": int(index),
+                "voxels": int(sizes[index]),
+                "volume_mm3": round(float(sizes[index]) * voxel_mm3, 2),
+                "bounding_box": {
+                    "min": [int(s.start) for s in box],
+                    "max": [int(s.stop) - 1 for s in box],
+                },
+                "centroid_voxel": _round(centroid),
+                "class_volumes_mm3": {
+                    REGION_NAMES[k]: round(float(composition[index, k]) * voxel_mm3, 2)
+                    for k in REGION_NAMES if k < num_classes
+                },
+            }
+            if affine is not None:
+                lesion["centroid_mm"] = _round(np.asarray(affine)[:3, :3] @ centroid + np.asarray(affine)[:3, 3])
+            lesions.append(lesion)
+
+    component_counts = {
+        REGION_NAMES[k]: int(ndimage.label(labels == k, structure=_CONNECTIVITY)[1]) if counts[k] else 0
+        for k in REGION_NAMES if k < num_classes
+    }
+
+    return {
+        "voxel_counts": {REGION_NAMES[k]: int(counts[k]) for k in REGION_NAMES if k < num_classes},
+        "volumes_mm3": {REGION_NAMES[k]: round(float(counts[k]) * voxel_mm3, 2) for k in REGION_NAMES if k < num_classes},
+        "total_tumor_volume_mm3": round(float(counts[1:].sum()) * voxel_mm3, 2),
+        "voxel_size_mm": _round(voxel_size[:3], 4),
+        "lesion_count": int(lesion_count),
+        "component_counts": component_counts,
+        "lesions": lesions,
+        "slice_area_mm2": {
+            REGION_NAMES[k]: _round(per_slice[:, k] * pixel_mm2)
+            for k in REGION_NAMES if k < num_classes
+        },
+    }
@@ -0,0 +1,99 @@
+"""
+Study-scoped storage for MRI uploads and pipeline outputs.
+
+Every study gets its own directory under MRI_SCANS_DIR, so concurrent
+predictions never share file names. Files are written to a temporary name
+and moved into place with os.replace, so readers only ever see complete
+files. Studies untouched for MRI_STUDY_RETENTION_DAYS are removed by
+`cleanup_studies`.
+
+The dashboard still loads volumes from `mri_scans/user/`, so "user" is the
+default study and is never expired.
+"""
+import os
+import re
+import time
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+
+MRI_SCANS_DIR = os.getenv("MRI_SCANS_DIR", "./patient_data/mri_scans")
+MRI_STUDY_RETENTION_DAYS = float(os.getenv("MRI_STUDY_RETENTION_DAYS", "7"))
+DEFAULT_STUDY_ID = "user"
+
+_STUDY_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_CLEANUP_INTERVAL_SECONDS = 3600
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+class StudyWorkspace:
+    def __init__(self, study_id=DEFAULT_STUDY_ID, root=MRI_SCANS_DIR):
+        if not _STUDY_ID_PATTERN.match(study_id):
+            raise ValueError(f"Invalid study id: {study_id!r}")
+        self.study_id = study_id
+        self.dir = os.path.join(root, study_id)
+
+    @classmethod
+    def create(cls, root=MRI_SCANS_DIR):
+        maybe_cleanup_studies(root)
+        workspace = cls(uuid.uuid4().hex, root)
+        os.makedirs(workspace.dir, exist_ok=True)
+        return workspace
+
+    def exists(self):
+        return os.path.isdir(self.dir)
+
+    def ensure(self):
+        os.makedirs(self.dir, exist_ok=True)
+        return self
+
+    def path(self, name):
+        """Path of `name` inside the study; rejects anything that is not a plain file name."""
+        if not name or os.path.basename(name) != name or name in (".", ".."):
+            raise ValueError(f"Invalid file name: {name!r}")
+        return os.path.join(self.dir, name)
+
+    @contextmanager
+    def atomic_path(self, name):
+        """
+        Yields a temporary path next to `name`; it replaces `name` only if the
+        block finishes without raising. The temporary name keeps the original
+        suffix so writers that sniff the extension (nibabel) behave the same.
+        """
+        final_path = self.path(name)
+        tmp_path = os.path.join(self.dir, f".tmp-{uuid.uuid4().hex}-{name}")
+        try:
+            yield tmp_path
+            os.replace(tmp_path, final_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def touch(self):
+        os.utime(self.dir)
+
+    def delete(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+def cleanup_studies(root=MRI_SCANS_DIR, max_age_days=MRI_STUDY_RETENTION_DAYS):
+    """Removes study directories whose last modification is older than `max_age_days`."""
+    if not os.path.isdir(root):
+        return []
+    cutoff = time.time() - max_age_days * 86400
+    removed = []
+    for entry in os.scandir(root):
+        if entry.name == DEFAULT_STUDY_ID or not entry.is_dir():
+            continue
+        if _STUDY_ID_PATTERN.match(entry.name) and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed.append(entry.name)
+    return removed
+
+def maybe_cleanup_studies(root=MRI_SCANS_DIR):
+    global _last_cleanup
+    with _cleanup_lock:
+        if time.time() - _last_cleanup < _CLEANUP_INTERVAL_SECONDS:
+            return
+        _last_cleanup = time.time()
+    cleanup_studies(root)
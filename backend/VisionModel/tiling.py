@@ -0,0 +1,93 @@
+"""
+Sliding-window inference on the native scan grid.
+
+Instead of shrinking each 240x240 slice to the 128x128 model grid, the
+slices are covered with overlapping 128x128 tiles at full resolution. Tile
+probabilities are blended with a Gaussian window that favours tile centres,
+where the network sees the most context, and normalised by the summed
+window so every pixel ends up with a weighted average of its predictions.
+
+Tiles from a block of slices go to the model together, which keeps batches
+large without holding every tile of the volume in memory at once.
+MRI_TILE_OVERLAP sets the fraction of a tile shared with its neighbour
+(0.5 gives 3x3 tiles on a 240x240 slice); MRI_TILE_SLICES sets how many
+slices are tiled per block.
+"""
+import os
+import cv2
+import numpy as np
+from VisionModel.preprocessing import load_volume, resize_stack
+
+MRI_TILE_OVERLAP = float(os.getenv("MRI_TILE_OVERLAP", "0.5"))
+MRI_TILE_SLICES = int(os.getenv("MRI_TILE_SLICES", "16"))
+
+def tile_origins(length, tile, overlap=MRI_TILE_OVERLAP):
+    """Start offsets of tiles covering `length` pixels, the last one flush with the edge."""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(round(tile * (1 - overlap))))
+    origins = list(range(0, length - tile + 1, stride))
+    if origins[-1] != length - tile:
+        origins.append(length - tile)
+    return origins
+
+def blend_window(tile, sigma_scale=0.125):
+    """Separable Gaussian weights for one tile, floored so edge pixels still count."""
+    centre = (tile - 1) / 2
+    axis = np.exp(-0.5 * ((np.arange(tile) - centre) / (tile * sigma_scale)) ** 2)
+    window = np.outer(axis, axis).astype(np.float32)
+    window /= window.max()
+    return np.maximum(window, 1e-3)
+
+def build_native_input(flair_path, t1ce_path, start=0, depth=155):
+    """Un-normalised (depth, H, W, 2) FLAIR/T1CE slices at the scan's native resolution."""
+    X = None
+    for channel, path in enumerate((flair_path, t1ce_path)):
+        volume = load_volume(path)
+        stack = volume[:, :, start:start + depth]
+        if X is None:
+            X = np.empty((stack.shape[2], stack.shape[0], stack.shape[1], 2), dtype=np.float32)
+        X[..., channel] = np.transpose(stack, (2, 0, 1))
+    return X
+
+def predict_tiled(X, predict_fn, tile=128, num_classes=4, overlap=MRI_TILE_OVERLAP, block_slices=MRI_TILE_SLICES):
+    """
+    Class probabilities for a normalised (N, H, W, C) native-resolution
+    input, returned as (N, H, W, num_classes). `predict_fn` takes a batch of
+    (tile, tile, C) tiles.
+    """
+    count, height, width, channels = X.shape
+    # Slices smaller than a tile are zero-padded up to it and cropped afterwards
+    padded_h, padded_w = max(height, tile), max(width, tile)
+    if (padded_h, padded_w) != (height, width):
+        X = np.pad(X, ((0, 0), (0, padded_h - height), (0, padded_w - width), (0, 0)))
+
+    origins = [(r, c) for r in tile_origins(padded_h, tile, overlap) for c in tile_origins(padded_w, tile, overlap)]
+    window = blend_window(tile)
+    coverage = np.zeros((padded_h, padded_w), dtype=np.float32)
+    for r, c in origins:
+        coverage[r:r + tile, c:c + tile] += window
+
+    output = np.zeros((count, padded_h, padded_w, num_classes), dtype=np.float32)
+    tiles = np.empty((len(origins), block_slices, tile, tile, channels), dtype=np.float32)
+    for start in range(0, count, block_slices):
+        stop = min(start + block_slices, count)
+        n = stop - start
+        for i, (r, c) in enumerate(origins):
+            tiles[i, :n] = X[start:stop, r:r + tile, c:c + tile]
+        probabilities = predict_fn(tiles[:, :n].reshape(-1, tile, tile, channels))
+        probabilities = probabilities.reshape(len(origins), n, tile, tile, num_classes)
+        for i, (r, c) in enumerate(origins):
+            output[start:stop, r:r + tile, c:c + tile] += probabilities[i] * window[:, :, None]
+
+    output /= coverage[:, :, None]
+    return output[:, :height, :width]
+
+def downsample_probabilities(probabilities, size):
+    """Area-averages (N, H, W, K) native probabilities onto the (N, size, size, K) model grid."""
+    count, _, _, classes = probabilities.shape
+    out = np.empty((count, size, size, classes), dtype=np.float32)
+    for k in range(classes):
+        stack = probabilities[..., k].transpose(1, 2, 0)
+        out[..., k] = resize_stack(stack, size, size, interpolation=cv2.INTER_AREA).transpose(2, 0, 1)
+    return out
@@ -0,0 +1,262 @@
+"""
+Streaming and resumable uploads of NIfTI volumes.
+
+Uploads are written in fixed-size chunks on a worker thread, so memory use
+stays flat regardless of the study size and the event loop is never blocked
+on disk I/O. While the bytes stream past, they are hashed and the gzip
+stream is decompressed just far enough to check the NIfTI-1 header.
+
+Large studies can also be sent in pieces: create a session, PUT chunks at
+the offset the server reports, and complete it once all bytes are in. A
+dropped connection only costs the chunk in flight. Chunks of one session are
+appended one request at a time, no upload may grow past UPLOAD_MAX_MB, and
+sessions idle for UPLOAD_SESSION_RETENTION_HOURS are swept away.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import struct
+import asyncio
+import hashlib
+import zlib
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Body, Query
+from VisionModel.storage import StudyWorkspace, DEFAULT_STUDY_ID
+
+router = APIRouter()
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_SESSIONS_DIR = os.getenv("UPLOAD_SESSIONS_DIR", "./patient_data/uploads")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "2048")) * 1024 * 1024
+UPLOAD_SESSION_RETENTION_HOURS = float(os.getenv("UPLOAD_SESSION_RETENTION_HOURS", "24"))
+
+NIFTI1_HEADER_SIZE = 348
+
+def parse_nifti_header(header_bytes):
+    """Checks the fixed NIfTI-1 header fields and returns the volume shape."""
+    if len(header_bytes) < NIFTI1_HEADER_SIZE:
+        raise ValueError("File is too short to be a NIfTI volume")
+    for endian in ("<", ">"):
+        if struct.unpack(f"{endian}i", header_bytes[:4])[0] == NIFTI1_HEADER_SIZE:
+            break
+    else:
+        raise ValueError("Not a NIfTI-1 file (bad sizeof_hdr)")
+    if header_bytes[344:348] not in (b"n+1\0", b"ni1\0"):
+        raise ValueError("Not a NIfTI-1 file (bad magic)")
+    dim = struct.unpack(f"{endian}8h", header_bytes[40:56])
+    if not 1 <= dim[0] <= 7 or any(d < 1 for d in dim[1:dim[0] + 1]):
+        raise ValueError("Invalid NIfTI dimensions")
+    return list(dim[1:dim[0] + 1])
+
+class NiftiStreamChecker:
+    """Hashes a .nii.gz byte stream and validates its header as it goes by."""
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.shape = None
+        self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._header = b""
+
+    def update(self, chunk):
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        if self.shape is None and len(self._header) < NIFTI1_HEADER_SIZE:
+            try:
+                self._header += self._inflater.decompress(chunk, NIFTI1_HEADER_SIZE - len(self._header))
+            except zlib.error:
+                raise ValueError("File is not gzip-compressed")
+            if len(self._header) >= NIFTI1_HEADER_SIZE:
+                self.shape = parse_nifti_header(self._header)
+
+    def result(self):
+        if self.shape is None:
+            parse_nifti_header(self._header)  # raises with the precise reason
+        return {"sha256": self.sha256.hexdigest(), "size": self.size, "shape": self.shape}
+
+async def stream_upload(file, workspace, name):
+    """
+    Copies an UploadFile into `workspace` chunk by chunk; returns hash, size
+    and shape. Uploads past UPLOAD_MAX_MB are rejected with a 413.
+    """
+    checker = NiftiStreamChecker()
+    with workspace.atomic_path(name) as tmp_path:
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                checker.update(chunk)
+                if checker.size > UPLOAD_MAX_BYTES:
+                    # atomic_path discards the partial file
+                    raise HTTPException(status_code=413, detail=f"Uploads are limited to {UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
+                await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+        info = checker.result()
+    return info
+
+def check_file(path):
+    checker = NiftiStreamChecker()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            checker.update(chunk)
+    return checker.result()
+
+# -----------------------
+# Resumable upload sessions
+# -----------------------
+class UploadSession:
+    def __init__(self, upload_id, root=UPLOAD_SESSIONS_DIR):
+        if not upload_id.isalnum():
+            raise ValueError("Invalid upload id")
+        self.upload_id = upload_id
+        self.dir = os.path.join(root, upload_id)
+        self.data_path = os.path.join(self.dir, "data.part")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+
+    @classmethod
+    def create(cls, filename, study_id, total_size=None):
+        session = cls(uuid.uuid4().hex)
+        os.makedirs(session.dir)
+        open(session.data_path, "wb").close()
+        with open(session.meta_path, "w") as f:
+            json.dump({"filename": filename, "study_id": study_id, "total_size": total_size}, f)
+        return session
+
+    def exists(self):
+        return os.path.isfile(self.meta_path)
+
+    def meta(self):
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def offset(self):
+        return os.path.getsize(self.data_path)
+
+    def last_modified(self):
+        # data.part is touched by every chunk, meta.json only at creation
+        try:
+            return os.path.getmtime(self.data_path)
+        except OSError:
+            return os.path.getmtime(self.dir)
+
+    def status(self):
+        return {"upload_id": self.upload_id, "offset": self.offset(), **self.meta()}
+
+    def delete(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+# One lock per session, so the offset check and the append happen as a unit
+_session_locks = {}
+
+def _session_lock(upload_id):
+    return _session_locks.setdefault(upload_id, asyncio.Lock())
+
+def cleanup_upload_sessions(root=UPLOAD_SESSIONS_DIR, max_age_hours=UPLOAD_SESSION_RETENTION_HOURS, busy=()):
+    """Removes sessions not written to for `max_age_hours`, skipping the ids in `busy`."""
+    if not os.path.isdir(root):
+        return []
+    cutoff = time.time() - max_age_hours * 3600
+    removed = []
+    for entry in os.scandir(root):
+        if not entry.is_dir() or not entry.name.isalnum() or entry.name in busy:
+            continue
+        session = UploadSession(entry.name, root)
+        if session.last_modified() < cutoff:
+            session.delete()
+            removed.append(entry.name)
+    return removed
+
+_CLEANUP_INTERVAL_SECONDS = 3600
+_last_cleanup = 0.0
+
+async def maybe_cleanup_upload_sessions():
+    global _last_cleanup
+    if time.time() - _last_cleanup < _CLEANUP_INTERVAL_SECONDS:
+        return
+    _last_cleanup = time.time()
+    busy = {upload_id for upload_id, lock in _session_locks.items() if lock.locked()}
+    for upload_id in await asyncio.to_thread(cleanup_upload_sessions, busy=busy):
+        _session_locks.pop(upload_id, None)
+
+def _get_session(upload_id):
+    try:
+        session = UploadSession(upload_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not session.exists():
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+@router.post("/api/mri/uploads", status_code=201)
+async def create_upload(
+    filename: str = Body(...),
+    study_id: str = Body(DEFAULT_STUDY_ID),
+    total_size: Optional[int] = Body(None),
+):
+    if not filename.endswith(".nii.gz"):
+        raise HTTPException(status_code=400, detail="Only .nii.gz files are accepted")
+    try:
+        workspace = StudyWorkspace(study_id)
+        workspace.path(filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if study_id != DEFAULT_STUDY_ID and not workspace.exists():
+        raise HTTPException(status_code=404, detail="Study not found")
+    if total_size is not None and total_size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Uploads are limited to {UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
+    await maybe_cleanup_upload_sessions()
+    session = await asyncio.to_thread(UploadSession.create, filename, study_id, total_size)
+    return session.status()
+
+@router.get("/api/mri/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    return _get_session(upload_id).status()
+
+@router.put("/api/mri/uploads/{upload_id}")
+async def append_upload_chunk(upload_id: str, request: Request, offset: int = Query(...)):
+    session = _get_session(upload_id)
+    async with _session_lock(upload_id):
+        if not session.exists():
+            raise HTTPException(status_code=404, detail="Upload not found")
+        current = session.offset()
+        if offset != current:
+            # The client resumes from whatever the server actually has
+            raise HTTPException(status_code=409, detail={"message": "Offset mismatch", "offset": current})
+        total_size = session.meta()["total_size"]
+
+        f = await asyncio.to_thread(open, session.data_path, "ab")
+        try:
+            async for chunk in request.stream():
+                current += len(chunk)
+                if total_size is not None and current > total_size:
+                    await asyncio.to_thread(f.truncate, offset)
+                    raise HTTPException(status_code=400, detail="Upload exceeds declared total_size")
+                if current > UPLOAD_MAX_BYTES:
+                    await asyncio.to_thread(f.truncate, offset)
+                    raise HTTPException(status_code=413, detail=f"Uploads are limited to {UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
+                await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+        return session.status()
+
+@router.post("/api/mri/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    session = _get_session(upload_id)
+    async with _session_lock(upload_id):
+        if not session.exists():
+            raise HTTPException(status_code=404, detail="Upload not found")
+        meta = session.meta()
+        if meta["total_size"] is not None and session.offset() != meta["total_size"]:
+            raise HTTPException(status_code=409, detail={"message": "Upload incomplete", "offset": session.offset()})
+        try:
+            info = await asyncio.to_thread(check_file, session.data_path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        workspace = StudyWorkspace(meta["study_id"]).ensure()
+        await asyncio.to_thread(os.replace, session.data_path, workspace.path(meta["filename"]))
+        await asyncio.to_thread(session.delete)
+    _session_locks.pop(upload_id, None)
+    return {"study_id": meta["study_id"], "filename": meta["filename"], **info}
@@ -1,40 +1,245 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import FileResponse, Response
+from typing import List
 import cv2
 import numpy as np
 import os
-import tempfile
-from ultralytics import YOLO
+import uuid
+import base64
+import asyncio
+import zipfile
+import threading
+from registry import lazy_resource
+from concurrency import BoundedExecutor, ExecutorSaturated, saturated_response
 
 app = FastAPI()
 router = APIRouter()
 
 YOLO_MODEL_PATH = os.getenv("YOLO_MODEL_PATH")
+YOLO_IMGSZ = 640
+YOLO_CONF = 0.5
+# Images per forward pass on the batch endpoint, and the most it accepts per request
+YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "16"))
+YOLO_MAX_BATCH_IMAGES = int(os.getenv("YOLO_MAX_BATCH_IMAGES", "256"))
+# Upper bound on the image bytes of one batch request, after zip archives are expanded
+YOLO_MAX_BATCH_BYTES = int(os.getenv("YOLO_MAX_BATCH_MB", "512")) * 1024 * 1024
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Encoding of annotated images returned in memory
+YOLO_IMAGE_FORMAT = os.getenv("YOLO_IMAGE_FORMAT", "jpeg")
+YOLO_IMAGE_QUALITY = int(os.getenv("YOLO_IMAGE_QUALITY", "90"))
+IMAGE_ENCODINGS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+RESPONSE_FORMATS = ("file", "image", "json")
+REPORT_DIR = "./VisionModel/report"
+# Decoding, inference and encoding run on this pool, never on the event loop;
+# requests beyond YOLO_WORKERS running + YOLO_MAX_QUEUE waiting get a 429
+YOLO_WORKERS = int(os.getenv("YOLO_WORKERS", "2"))
+YOLO_MAX_QUEUE = int(os.getenv("YOLO_MAX_QUEUE", "8"))
 
-model = YOLO(YOLO_MODEL_PATH)
+yolo_executor = BoundedExecutor("yolo", YOLO_WORKERS, YOLO_MAX_QUEUE)
+# The model is shared and ultralytics predictors are not thread-safe, so forward
+# passes take turns; extra workers overlap decoding and encoding with inference
+_predict_lock = threading.Lock()
+
+def load_yolo_model():
+    from ultralytics import YOLO
+    return YOLO(YOLO_MODEL_PATH)
+
+def warm_up_yolo_model(model):
+    model.predict(source=np.zeros((YOLO_IMGSZ, YOLO_IMGSZ, 3), dtype=np.uint8), imgsz=YOLO_IMGSZ, verbose=False)
+
+yolo_model = lazy_resource("yolo_model", load_yolo_model, warmup=warm_up_yolo_model, required=True)
 
 def read_imagefile(file_bytes: bytes) -> np.ndarray:
     nparr = np.frombuffer(file_bytes, np.uint8)
     img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
     return img
 
+def run_model(source):
+    with yolo_executor.stage("inference"), _predict_lock:
+        return yolo_model.get().predict(source=source, imgsz=YOLO_IMGSZ, conf=YOLO_CONF, verbose=False)
+
+def encode_image(image, image_format=YOLO_IMAGE_FORMAT, quality=YOLO_IMAGE_QUALITY):
+    """Encodes a BGR image in memory; returns (bytes, media type)."""
+    extension, media_type, quality_flag = IMAGE_ENCODINGS[image_format]
+    ok, encoded = cv2.imencode(extension, image, [quality_flag, quality])
+    if not ok:
+        raise HTTPException(status_code=500, detail=f"Could not encode the annotated image as {image_format}")
+    return encoded.tobytes(), media_type
+
 @router.post("/predict/")
-async def predict_image(file: UploadFile = File(...)):
-    if not file.filename.lower().endswith((".jpg", ".jpeg", ".png")):
+async def predict_image(
+    file: UploadFile = File(...),
+    response_format: str = Form("image"),
+    image_format: str = Form(YOLO_IMAGE_FORMAT),
+    quality: int = Form(YOLO_IMAGE_QUALITY),
+):
+    """
+    `response_format` selects what comes back:
+        image  the annotated image encoded in memory as `image_format`
+               (jpeg or webp) at `quality`, streamed as the response body
+               (default)
+        file   the annotated image written to its own file under
+               VisionModel/report (legacy)
+        json   detections only, no image is drawn
+    """
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"response_format must be one of: {', '.join(RESPONSE_FORMATS)}")
+    if image_format not in IMAGE_ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"image_format must be one of: {', '.join(IMAGE_ENCODINGS)}")
+    if not file.filename.lower().endswith(IMAGE_EXTENSIONS):
         raise HTTPException(status_code=400, detail="Only image files (jpg, jpeg, png) are accepted")
     file_bytes = await file.read()
-    image = read_imagefile(file_bytes)
+    try:
+        return await yolo_executor.run(
+            predict_single, file.filename, file_bytes, response_format, image_format, max(1, min(quality, 100)),
+        )
+    except ExecutorSaturated as e:
+        raise saturated_response(e)
+
+def predict_single(filename, file_bytes, response_format, image_format, quality):
+    """Blocking body of /predict/, run on the YOLO executor."""
+    with yolo_executor.stage("decode"):
+        image = read_imagefile(file_bytes)
     if image is None:
         raise HTTPException(status_code=400, detail="Error processing the image file")
-    results = model.predict(source=image, imgsz=640, conf=0.5)
-    annotated_image = results[0].plot(line_width=1)
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
-        output_path = temp_file.name
-        cv2.imwrite(output_path, annotated_image)
-    report_path = "./VisionModel/report/annotated_image.jpg"
-    cv2.imwrite(report_path, annotated_image)
-    image_path = "./backend/VisionModel/report/annotated_image.jpg"
+    results = run_model(image)
+
+    if response_format == "json":
+        return {"filename": filename, "detections": detections(results[0])}
+
+    with yolo_executor.stage("encode"):
+        annotated_image = results[0].plot(line_width=1)
+        if response_format == "image":
+            content, media_type = encode_image(annotated_image, image_format, quality)
+            return Response(
+                content=content,
+                media_type=media_type,
+                headers={"X-Detection-Count": str(len(results[0].boxes))},
+            )
+
+        # One file per request, published atomically, so concurrent calls never
+        # return each other's image
+        name = f"annotated_image_{uuid.uuid4().hex}.jpg"
+        report_path = os.path.join(REPORT_DIR, name)
+        tmp_path = os.path.join(REPORT_DIR, f".tmp-{name}")
+        cv2.imwrite(tmp_path, annotated_image)
+        os.replace(tmp_path, report_path)
+    image_path = f"./backend/VisionModel/report/{name}"
     return {"result": FileResponse(path=image_path, media_type="image/jpeg", filename="annotated_image.jpg")}
 
+# -----------------------
+# Batch prediction
+# -----------------------
+def detections(result):
+    """JSON-serialisable boxes of one ultralytics result."""
+    boxes = result.boxes
+    return [
+        {
+            "class_id": int(cls),
+            "class_name": result.names[int(cls)],
+            "confidence": round(float(conf), 4),
+            "box_xyxy": [round(float(v), 1) for v in xyxy],
+        }
+        for xyxy, conf, cls in zip(boxes.xyxy.tolist(), boxes.conf.tolist(), boxes.cls.tolist())
+    ]
+
+def predict_batch(entries, annotated, batch_size=YOLO_BATCH_SIZE):
+    """
+    Blocking body of /predict/batch/, run on the YOLO executor: decodes
+    `entries` and runs YOLO over them in forward passes of up to
+    `batch_size` images.
+    """
+    names, images, errors = [], [], []
+    with yolo_executor.stage("decode"):
+        for name, data in entries:
+            image = read_imagefile(data)
+            if image is None:
+                errors.append({"filename": name, "error": "Error processing the image file"})
+            else:
+                names.append(name)
+                images.append(image)
+
+    results = []
+    for start in range(0, len(images), batch_size):
+        results.extend(run_model(images[start:start + batch_size]))
+
+    predictions = []
+    for name, result in zip(names, results):
+        prediction = {"filename": name, "detections": detections(result)}
+        if annotated:
+            with yolo_executor.stage("encode"):
+                content, media_type = encode_image(result.plot(line_width=1))
+            prediction["annotated_image"] = base64.b64encode(content).decode("ascii")
+            prediction["media_type"] = media_type
+        predictions.append(prediction)
+    return {"count": len(predictions), "predictions": predictions, "errors": errors}
+
+def batch_too_large(detail):
+    return HTTPException(status_code=413, detail=detail)
+
+def extract_zip_images(name, fileobj, max_images, max_bytes):
+    """
+    (filename, bytes) for the images in one zip upload. The entry count and
+    the uncompressed sizes from the central directory are checked against the
+    remaining limits before any entry is inflated; zipfile stops reading an
+    entry at its declared size, so a forged size cannot inflate past them.
+    """
+    try:
+        with zipfile.ZipFile(fileobj) as archive:
+            infos = [
+                info for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+            if len(infos) > max_images:
+                raise batch_too_large(f"At most {YOLO_MAX_BATCH_IMAGES} images per request")
+            if sum(info.file_size for info in infos) > max_bytes:
+                raise batch_too_large(f"At most {YOLO_MAX_BATCH_BYTES // (1024 * 1024)} MB of images per request")
+            return [(info.filename, archive.read(info)) for info in infos]
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail=f"{name} is not a valid zip archive")
+
+async def read_batch_images(files):
+    """(filename, bytes) for every image upload, with .zip uploads expanded off the event loop."""
+    entries, total_bytes = [], 0
+    for file in files:
+        name = file.filename or ""
+        if name.lower().endswith(".zip"):
+            # Read straight from the spooled upload, not a second in-memory copy
+            images = await asyncio.to_thread(
+                extract_zip_images, name, file.file,
+                YOLO_MAX_BATCH_IMAGES - len(entries), YOLO_MAX_BATCH_BYTES - total_bytes,
+            )
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            images = [(name, await file.read())]
+        else:
+            raise HTTPException(status_code=400, detail=f"{name}: only jpg, jpeg, png or zip files are accepted")
+        entries.extend(images)
+        total_bytes += sum(len(data) for _, data in images)
+        if len(entries) > YOLO_MAX_BATCH_IMAGES:
+            raise batch_too_large(f"At most {YOLO_MAX_BATCH_IMAGES} images per request")
+        if total_bytes > YOLO_MAX_BATCH_BYTES:
+            raise batch_too_large(f"At most {YOLO_MAX_BATCH_BYTES // (1024 * 1024)} MB of images per request")
+    return entries
+
+@router.post("/predict/batch/")
+async def predict_images(files: List[UploadFile] = File(...), annotated: bool = Form(False)):
+    """
+    Detections for many images in one request. Images may be uploaded as
+    separate files or inside zip archives; with `annotated`, each result also
+    carries the annotated image base64-encoded in YOLO_IMAGE_FORMAT.
+    """
+    entries = await read_batch_images(files)
+    if not entries:
+        raise HTTPException(status_code=400, detail="No images found in the upload")
+    try:
+        return await yolo_executor.run(predict_batch, entries, annotated)
+    except ExecutorSaturated as e:
+        raise saturated_response(e)
 
+@router.get("/metrics/")
+async def yolo_metrics():
+    """Queue depth, rejections and per-stage latency (queue, decode, inference, encode, total)."""
+    return yolo_executor.metrics()
@@ -0,0 +1,114 @@
+"""
+JWT issuing and verification for protected routes.
+
+`get_current_user` is a FastAPI dependency that checks the bearer token
+issued at sign-in or sign-up and returns a small snapshot of the caller:
+id, role, name and email. Verified tokens are kept in a TTL LRU keyed by
+the token, together with that snapshot, so repeated calls skip both the
+signature check and the Mongo lookup of the user document. An entry lives
+for at most AUTH_CACHE_TTL_SECONDS and never past the token's own expiry;
+AUTH_CACHE_SIZE bounds the number of entries.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import jwt
+from bson import ObjectId
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from database import get_db
+
+load_dotenv()
+SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
+JWT_ALGORITHM = "HS256"
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+
+ROLE_COLLECTIONS = {"doctor": "doctors", "patient": "patients"}
+PROFILE_FIELDS = {"name": 1, "email": 1}
+
+def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=1)):
+    to_encode = data.copy()
+    expire = datetime.utcnow() + expires_delta
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+class ClaimsCache:
+    """Thread-safe LRU of token -> user snapshot with a per-entry deadline."""
+
+    def __init__(self, max_size=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            deadline, user = entry
+            if deadline <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return user
+
+    def put(self, token, user, expires_at):
+        deadline = min(time.time() + self.ttl, expires_at)
+        with self._lock:
+            self._entries[token] = (deadline, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+claims_cache = ClaimsCache()
+_bearer = HTTPBearer(auto_error=False)
+
+def _unauthorized(detail):
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(_bearer)):
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    token = credentials.credentials
+    user = claims_cache.get(token)
+    if user is not None:
+        return user
+
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM], options={"require": ["exp"]})
+    except jwt.ExpiredSignatureError:
+        raise _unauthorized("Token expired")
+    except jwt.InvalidTokenError:
+        raise _unauthorized("Invalid token")
+
+    user_id, role = claims.get("id"), claims.get("role")
+    if role not in ROLE_COLLECTIONS or not ObjectId.is_valid(user_id):
+        raise _unauthorized("Invalid token")
+    profile = await get_db()[ROLE_COLLECTIONS[role]].find_one({"_id": ObjectId(user_id)}, PROFILE_FIELDS)
+    if not profile:
+        raise _unauthorized("User no longer exists")
+
+    user = {"id": user_id, "role": role, "name": profile.get("name"), "email": profile.get("email")}
+    claims_cache.put(token, user, claims["exp"])
+    return user
+
+def require_role(*roles):
+    """Dependency that admits only callers with one of `roles`."""
+    async def check_role(user: dict = Depends(get_current_user)):
+        if user["role"] not in roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+        return user
+    return check_role
@@ -0,0 +1,127 @@
+"""
+Latency of the patient and report listing endpoints against the previous
+one-query-per-item implementations, for a doctor monitoring many patients
+and a patient with many reports.
+
+The benchmark seeds its own database and drops it afterwards, so point
+BENCHMARK_MONGO_URI at a throwaway database, never the application one.
+Run from the backend directory:
+    BENCHMARK_MONGO_URI=mongodb://localhost:27017/neuroview_benchmark python -m benchmarks.listing
+    python -m benchmarks.listing --sizes 10 100 500
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from bson import ObjectId
+from pymongo.uri_parser import parse_uri
+import database
+from database import get_db
+from server import get_doctor_patients, get_patient_reports
+
+BENCHMARK_MONGO_URI = os.getenv("BENCHMARK_MONGO_URI", "mongodb://localhost:27017/neuroview_benchmark")
+
+async def legacy_doctor_patients(doctor_id):
+    doctor = await get_db().doctors.find_one({"_id": ObjectId(doctor_id)})
+    patients = []
+    for monitored in doctor.get("patients_monitored", []):
+        patient = await get_db().patients.find_one({"_id": ObjectId(monitored["patient_id"])})
+        if patient:
+            patients.append({"_id": str(patient["_id"]), "name": patient["name"], "email": patient["email"]})
+    return patients
+
+async def legacy_patient_reports(patient_id):
+    patient = await get_db().patients.find_one({"_id": ObjectId(patient_id)})
+    reports = []
+    for report_id in patient.get("report_ids", []):
+        report = await get_db().reports.find_one({"_id": ObjectId(report_id)})
+        if report:
+            reports.append({
+                "id": str(report["_id"]),
+                "name": report.get("name", "Medical Report"),
+                "date": report.get("timestamp", ""),
+                "doctor_id": report.get("doctor_id", ""),
+                "html_path": report.get("html_path", ""),
+            })
+    for report in reports:
+        if report["doctor_id"]:
+            doctor = await get_db().doctors.find_one({"_id": ObjectId(report["doctor_id"])})
+            if doctor:
+                report["doctor_name"] = doctor.get("name", "Unknown Doctor")
+    return reports
+
+async def seed(size, doctor_pool=20):
+    db = get_db()
+    await db.doctors.delete_many({})
+    await db.patients.delete_many({})
+    await db.reports.delete_many({})
+
+    doctors = await db.doctors.insert_many([
+        {"name": f"Doctor {i}", "email": f"dr.bench{i}@example.com", "specialization": "Neurology", "patients_monitored": []}
+        for i in range(doctor_pool)
+    ])
+    doctor_ids = [str(_id) for _id in doctors.inserted_ids]
+
+    patients = await db.patients.insert_many([
+        {"name": f"Patient {i:05d}", "email": f"bench{i}@example.com", "medical_records": [], "report_ids": []}
+        for i in range(size)
+    ])
+    patient_ids = [str(_id) for _id in patients.inserted_ids]
+    await db.doctors.update_one(
+        {"_id": ObjectId(doctor_ids[0])},
+        {"$set": {"patients_monitored": [
+            {"patient_id": pid, "name": f"Patient {i:05d}", "medications_given": []} for i, pid in enumerate(patient_ids)
+        ]}},
+    )
+
+    reports = await db.reports.insert_many([
+        {"patient_id": patient_ids[0], "doctor_id": doctor_ids[i % doctor_pool],
+         "html_path": f"./patient/{patient_ids[0]}/medical_report_{i}.html", "timestamp": datetime.utcnow()}
+        for i in range(size)
+    ])
+    await db.patients.update_one(
+        {"_id": ObjectId(patient_ids[0])},
+        {"$set": {"report_ids": [str(_id) for _id in reports.inserted_ids]}},
+    )
+    return doctor_ids[0], patient_ids[0]
+
+async def timed(fn, arg, repeats):
+    result = await fn(arg)  # warm the pool and the server cache
+    start = time.perf_counter()
+    for _ in range(repeats):
+        await fn(arg)
+    return result, (time.perf_counter() - start) / repeats * 1000
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 500])
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    benchmark_db = parse_uri(BENCHMARK_MONGO_URI)["database"]
+    if not benchmark_db or (database.MONGO_URI and benchmark_db == parse_uri(database.MONGO_URI)["database"]):
+        sys.exit("BENCHMARK_MONGO_URI must name a separate, throwaway database")
+
+    database.connect(BENCHMARK_MONGO_URI)
+    try:
+        print(f"{'items':>6}  {'endpoint':<18}{'N+1 ms':>10}{'$in ms':>10}{'speedup':>9}")
+        for size in args.sizes:
+            doctor_id, patient_id = await seed(size)
+            for name, legacy, current, arg in (
+                ("doctor patients", legacy_doctor_patients,
+                 lambda i: get_doctor_patients(i, user={"id": i, "role": "doctor"}), doctor_id),
+                ("patient reports", legacy_patient_reports,
+                 lambda i: get_patient_reports(i, user={"id": i, "role": "patient"}), patient_id),
+            ):
+                expected, legacy_ms = await timed(legacy, arg, args.repeats)
+                result, current_ms = await timed(current, arg, args.repeats)
+                assert result == expected, f"{name}: results differ from the legacy implementation"
+                print(f"{size:>6}  {name:<18}{legacy_ms:>10.1f}{current_ms:>10.1f}{legacy_ms / current_ms:>8.1f}x")
+    finally:
+        await database.connect().drop_database(benchmark_db)
+        database.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
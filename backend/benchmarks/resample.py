@@ -0,0 +1,58 @@
+"""
+Compares the original per-slice cv2.resize loop against the vectorized
+`resample_volume` stage on the sample volumes in patient_data/test_scan.
+
+Run from the backend directory:
+    python -m benchmarks.resample
+"""
+import time
+import tracemalloc
+import cv2
+import nibabel as nib
+import numpy as np
+from VisionModel.preprocessing import load_volume, resample_volume
+
+IMG_SIZE = 128
+VOLUME_SLICES = 155
+FLAIR_PATH = "./patient_data/test_scan/test_flair.nii.gz"
+T1CE_PATH = "./patient_data/test_scan/test_t1ce.nii.gz"
+
+def per_slice():
+    X = np.empty((VOLUME_SLICES, IMG_SIZE, IMG_SIZE, 2))
+    flair = nib.load(FLAIR_PATH).get_fdata()
+    ce = nib.load(T1CE_PATH).get_fdata()
+    for j in range(VOLUME_SLICES):
+        X[j,:,:,0] = cv2.resize(flair[:,:,j], (IMG_SIZE,IMG_SIZE))
+        X[j,:,:,1] = cv2.resize(ce[:,:,j], (IMG_SIZE,IMG_SIZE))
+    return X
+
+def vectorized():
+    X = np.empty((VOLUME_SLICES, IMG_SIZE, IMG_SIZE, 2), dtype=np.float32)
+    flair = load_volume(FLAIR_PATH)
+    resample_volume(flair, X[:,:,:,0])
+    del flair
+    ce = load_volume(T1CE_PATH)
+    resample_volume(ce, X[:,:,:,1])
+    return X
+
+def measure(fn, repeats=5):
+    fn()  # warm the file cache
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(timings), peak
+
+if __name__ == "__main__":
+    reference, loop_time, loop_peak = measure(per_slice)
+    result, vec_time, vec_peak = measure(vectorized)
+    print(f"per-slice loop : {loop_time * 1000:8.1f} ms  peak {loop_peak / 2**20:7.1f} MiB")
+    print(f"vectorized     : {vec_time * 1000:8.1f} ms  peak {vec_peak / 2**20:7.1f} MiB")
+    print(f"speedup        : {loop_time / vec_time:8.2f}x")
+    print(f"max abs diff   : {np.max(np.abs(reference - result)):.3e} "
+          f"(relative {np.max(np.abs(reference - result)) / np.max(np.abs(reference)):.3e})")
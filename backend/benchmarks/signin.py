@@ -0,0 +1,85 @@
+"""
+Sign-in throughput as the password pool grows.
+
+By default the bcrypt verification behind /signin is driven in-process
+through a `BoundedExecutor` with 1, 2, 4 ... up to the core count workers,
+which shows whether verification scales with cores (bcrypt releases the
+GIL while hashing). With --url, concurrent POST /signin requests are sent
+to a running server instead; set PASSWORD_WORKERS on the server between
+runs to compare pool sizes end to end.
+
+Run from the backend directory:
+    python -m benchmarks.signin
+    python -m benchmarks.signin --url http://localhost:8000 --email user@example.com --password secret
+"""
+import os
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from concurrency import BoundedExecutor
+from passwords import pwd_context, BCRYPT_ROUNDS
+
+def worker_counts(limit):
+    counts, n = [], 1
+    while n < limit:
+        counts.append(n)
+        n *= 2
+    return counts + [limit]
+
+async def in_process(workers, logins):
+    hashed = pwd_context.hash("benchmark-password")
+    executor = BoundedExecutor("bench", workers, max_queue=logins)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        executor.run(pwd_context.verify_and_update, "benchmark-password", hashed) for _ in range(logins)
+    ))
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    assert all(valid for valid, _ in results)
+    return logins / elapsed, executor.metrics()["stages"]["total"]["p95_ms"]
+
+def over_http(url, email, password, concurrency, logins):
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def signin(_):
+        start = time.perf_counter()
+        response = session.post(f"{url}/signin", json={"email": email, "password": password})
+        return response.status_code, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(signin, range(logins)))
+        elapsed = time.perf_counter() - start
+    latencies = sorted(seconds for _, seconds in results)
+    failures = sum(1 for status, _ in results if status != 200)
+    return logins / elapsed, latencies[int(0.95 * (len(latencies) - 1))] * 1000, failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--url")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    if args.url:
+        print(f"{'clients':>8}{'logins/s':>10}{'p95 ms':>10}{'failed':>8}")
+        for concurrency in args.concurrency:
+            rate, p95, failures = over_http(args.url, args.email, args.password, concurrency, args.logins)
+            print(f"{concurrency:>8}{rate:>10.1f}{p95:>10.1f}{failures:>8}")
+        return
+
+    print(f"bcrypt cost {BCRYPT_ROUNDS}, {os.cpu_count()} cores")
+    print(f"{'workers':>8}{'logins/s':>10}{'p95 ms':>10}")
+    for workers in worker_counts(os.cpu_count() or 1):
+        rate, p95 = asyncio.run(in_process(workers, args.logins))
+        print(f"{workers:>8}{rate:>10.1f}{p95:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Compares the default resample path (slices shrunk to 128x128, labels
+upsampled with nearest-neighbour lookup) against tiled native-resolution
+inference at several overlaps on the sample study.
+
+Run from the backend directory:
+    python -m benchmarks.tiling
+    python -m benchmarks.tiling --overlaps 0 0.25 0.5 --reference path/to/seg.nii.gz
+
+Throughput is reported as seconds per volume and model tiles per second.
+Quality is reported as per-class voxel counts and lesion counts on the
+native grid; with --reference (a native-grid BraTS label volume, where
+label 4 is enhancing tumor) per-class Dice against it is reported too.
+Without a reference, the agreement of each tiled run with the resample path
+shows how much detail the downsampling loses.
+"""
+import os
+import time
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from scipy import ndimage
+from VisionModel.preprocessing import build_model_input, foreground_extent, load_volume
+from VisionModel.tiling import build_native_input, predict_tiled, tile_origins, downsample_probabilities
+from VisionModel.geometry import ResampledGeometry
+from VisionModel.metadata import read_header
+
+load_dotenv()
+os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+
+IMG_SIZE = 128
+VOLUME_SLICES = 155
+FLAIR_PATH = "./patient_data/test_scan/test_flair.nii.gz"
+T1CE_PATH = "./patient_data/test_scan/test_t1ce.nii.gz"
+CLASS_NAMES = {1: "necrotic", 2: "edema", 3: "enhancing"}
+
+def resample_labels(backend, geometry):
+    X = build_model_input(FLAIR_PATH, T1CE_PATH, size=IMG_SIZE, depth=VOLUME_SLICES)
+    start, stop = foreground_extent(X)["z"]
+    X /= np.max(X)
+    labels = np.zeros((VOLUME_SLICES, IMG_SIZE, IMG_SIZE), dtype=np.uint8)
+    labels[start:stop] = np.argmax(backend.predict(X[start:stop]), axis=-1)
+    labels = np.transpose(labels, (1, 2, 0))
+    return geometry.upsample_labels(labels), labels, stop - start
+
+def tiled_labels(backend, overlap):
+    X = build_model_input(FLAIR_PATH, T1CE_PATH, size=IMG_SIZE, depth=VOLUME_SLICES)
+    start, stop = foreground_extent(X)["z"]
+    native = build_native_input(FLAIR_PATH, T1CE_PATH, depth=VOLUME_SLICES)
+    native /= np.max(native)
+    probabilities = np.zeros(native.shape[:3] + (len(CLASS_NAMES) + 1,), dtype=np.float32)
+    probabilities[..., 0] = 1.0
+    probabilities[start:stop] = predict_tiled(native[start:stop], backend.predict, tile=IMG_SIZE, overlap=overlap)
+    labels = np.argmax(probabilities, axis=-1).astype(np.uint8)
+    # The model-grid outputs the viewer reads come from the same step as in the pipeline
+    grid_labels = np.argmax(downsample_probabilities(probabilities, IMG_SIZE), axis=-1).astype(np.uint8)
+    tiles = len(tile_origins(native.shape[1], IMG_SIZE, overlap)) * len(tile_origins(native.shape[2], IMG_SIZE, overlap))
+    return np.transpose(labels, (1, 2, 0)), np.transpose(grid_labels, (1, 2, 0)), (stop - start) * tiles
+
+def timed(fn, repeats):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeats
+
+def dice(a, b):
+    total = a.sum() + b.sum()
+    return 1.0 if total == 0 else 2.0 * np.logical_and(a, b).sum() / total
+
+def quality(labels, reference=None, baseline=None):
+    row = {}
+    for k, name in CLASS_NAMES.items():
+        mask = labels == k
+        row[f"{name}_voxels"] = int(mask.sum())
+        row[f"{name}_lesions"] = int(ndimage.label(mask)[1])
+        if reference is not None:
+            row[f"{name}_dice"] = round(dice(mask, reference == k), 4)
+        if baseline is not None:
+            row[f"{name}_agreement"] = round(dice(mask, baseline == k), 4)
+    return row
+
+def main():
+    from VisionModel.backends import create_backend, SEGMENTATION_BACKEND
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--overlaps", nargs="+", type=float, default=[0.0, 0.25, 0.5])
+    parser.add_argument("--reference", help="native-grid ground-truth label volume")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    backend = create_backend(SEGMENTATION_BACKEND, keras_model_path=os.getenv("MODEL_PATH"))
+    geometry = ResampledGeometry(read_header(T1CE_PATH), (IMG_SIZE, IMG_SIZE), depth=VOLUME_SLICES)
+    reference = None
+    if args.reference:
+        reference = np.asarray(load_volume(args.reference)).astype(np.uint8)
+        reference[reference == 4] = 3  # BraTS enhancing label -> model class 3
+
+    (baseline, baseline_grid, slices), seconds = timed(lambda: resample_labels(backend, geometry), args.repeats)
+    rows = [("resample", seconds, slices / seconds, quality(baseline, reference))]
+    for overlap in args.overlaps:
+        (labels, grid_labels, tiles), seconds = timed(lambda: tiled_labels(backend, overlap), args.repeats)
+        row = quality(labels, reference, baseline)
+        row["model_grid_agreement"] = round(float(np.mean(grid_labels == baseline_grid)), 4)
+        rows.append((f"tiled {overlap:g}", seconds, tiles / seconds, row))
+
+    for name, seconds, rate, row in rows:
+        print(f"{name:<12} {seconds:7.2f} s/volume  {rate:8.1f} tiles/s")
+        for key, value in row.items():
+            print(f"    {key:<22} {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Bounded executors for blocking work called from async routes.
+
+A `BoundedExecutor` runs blocking functions on its own thread pool so they
+never stall the event loop, and caps how much work may wait for a thread:
+once `max_workers + max_queue` tasks are in flight, `run()` raises
+`ExecutorSaturated` straight away instead of letting latency grow without
+bound, and routes turn that into a 429 with the current queue depth.
+
+Each executor keeps latency statistics per named stage ("queue" is recorded
+for every task; the task itself can record more through `stage()`), which
+`metrics()` reports for the metrics endpoints.
+"""
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+
+LATENCY_WINDOW = 1000
+
+class ExecutorSaturated(Exception):
+    def __init__(self, name, in_flight, capacity, queue_depth):
+        super().__init__(f"{name} executor is saturated ({in_flight}/{capacity} tasks in flight)")
+        self.name = name
+        self.in_flight = in_flight
+        self.capacity = capacity
+        self.queue_depth = queue_depth
+
+class StageLatency:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self):
+        recent = sorted(self.recent)
+        def percentile(q):
+            return round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 2) if recent else None
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 2) if self.count else None,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+class BoundedExecutor:
+    def __init__(self, name, max_workers=1, max_queue=16):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._rejected = 0
+        self._completed = 0
+        self._stages = {}
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    def queue_depth(self):
+        """Tasks accepted but still waiting for a worker thread."""
+        with self._lock:
+            return self._in_flight - self._running
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._stages.setdefault(stage, StageLatency()).add(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Times a block of the running task under `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def _call(self, submitted, fn, args, kwargs):
+        with self._lock:
+            self._running += 1
+        self.record("queue", time.perf_counter() - submitted)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.record("total", time.perf_counter() - start)
+            with self._lock:
+                self._running -= 1
+                self._in_flight -= 1
+                self._completed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs `fn` on the pool; raises ExecutorSaturated when no slot is free."""
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._rejected += 1
+                raise ExecutorSaturated(self.name, self._in_flight, self.capacity, self._in_flight - self._running)
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(self._call, time.perf_counter(), fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        return await asyncio.wrap_future(future)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "running": self._running,
+                "queue_depth": self._in_flight - self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "stages": {name: latency.summary() for name, latency in self._stages.items()},
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def saturated_response(error):
+    """HTTP 429 for a saturated executor; `queue_position` is where a retry would land if a slot freed now."""
+    return HTTPException(
+        status_code=429,
+        detail={
+            "message": f"The {error.name} service is busy, retry shortly",
+            "queue_position": error.queue_depth + 1,
+            "queue_depth": error.queue_depth,
+            "capacity": error.capacity,
+        },
+        headers={"Retry-After": "1"},
+    )
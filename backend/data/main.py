@@ -1,31 +1,25 @@
+import sys
 import nibabel as nib
 import numpy as np
-from scipy.ndimage import zoom
 
-# Load the original NIfTI file
-input_path = "../patient_data/mri_scans/user/segmentation_output.nii.gz"
-img = nib.load(input_path)
-data = img.get_fdata()
-affine = img.affine
-
-# Print original shape
-print(f"Original shape: {data.shape}")  # Should be (128, 128, 155)
+sys.path.append("..")
+from VisionModel.geometry import ResampledGeometry
+from VisionModel.metadata import read_header
 
-# Define target shape
-target_shape = (240, 240, 155)
+# The prediction pipeline already writes segmentation_native.nii; this
+# script only converts segmentations produced before that stage existed.
+input_path = "../patient_data/mri_scans/user/segmentation_output.nii"
+reference_path = "../patient_data/mri_scans/user/filename_t1ce.nii.gz"
 
-# Compute zoom factors (only for x and y, keep z same)
-zoom_factors = (
-    target_shape[0] / data.shape[0],
-    target_shape[1] / data.shape[1],
-    1.0 
-)
+img = nib.load(input_path)
+labels = np.asanyarray(img.dataobj).astype(np.uint8)
 
-# Resize using interpolation
-resized_data = zoom(data, zoom_factors, order=3)  # order=3 is cubic interpolation
+# Print original shape
+print(f"Original shape: {labels.shape}")  # Should be (128, 128, 155)
 
-# Save resized NIfTI
-resized_img = nib.Nifti1Image(resized_data, affine)
+# Nearest-neighbour upsampling keeps labels exact, unlike a cubic zoom
+geometry = ResampledGeometry(read_header(reference_path), labels.shape[:2], depth=labels.shape[2])
+resized_img = geometry.native_image(geometry.upsample_labels(labels))
 output_path = "resized_file.nii.gz"
 nib.save(resized_img, output_path)
 
@@ -0,0 +1,79 @@
+"""
+Shared MongoDB access for every router.
+
+One `AsyncIOMotorClient` is created when the app starts and closed when it
+shuts down; its connection pool is sized with the MONGO_* settings below and
+shared by all requests. Routes reach the database through `get_db()` rather
+than opening clients of their own.
+
+`ensure_indexes()` declares the indexes the queries rely on, so email
+lookups at sign-in and sign-up, report lookups by patient or doctor and the
+paginated patient listing use an index instead of a collection scan. Creating an index that already
+exists is a no-op, so it runs on every startup.
+"""
+import os
+import logging
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel
+from pymongo.collation import Collation
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+# Case-insensitive ordering for name listings; queries must pass the same
+# collation to use the index
+NAME_COLLATION = Collation(locale="en", strength=2)
+
+INDEXES = {
+    "doctors": [IndexModel([("email", ASCENDING)], unique=True, name="email_unique")],
+    "patients": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("name", ASCENDING), ("_id", ASCENDING)], collation=NAME_COLLATION, name="name_id"),
+    ],
+    "reports": [
+        IndexModel([("patient_id", ASCENDING)], name="patient_id"),
+        IndexModel([("doctor_id", ASCENDING)], name="doctor_id"),
+    ],
+}
+
+_client = None
+
+def connect(uri=MONGO_URI):
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(
+            uri,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        )
+    return _client
+
+def get_db():
+    if _client is None:
+        raise RuntimeError("The database client is not connected; call database.connect() at startup")
+    return _client.get_default_database()
+
+async def ensure_indexes(db=None):
+    db = get_db() if db is None else db
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # e.g. duplicate emails already stored; the app still runs, just without the index
+            logger.error("Could not create indexes on %s: %s", collection, e)
+
+def close():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
@@ -0,0 +1,56 @@
+"""
+Password hashing off the event loop.
+
+bcrypt is deliberately slow (about 100-300 ms of CPU per hash or verify at
+the default cost), so the async routes hand it to a bounded thread pool
+instead of running it inline. The bcrypt library releases the GIL while
+hashing, so throughput scales with PASSWORD_WORKERS up to the core count;
+once PASSWORD_MAX_QUEUE requests are waiting, new ones get a 429.
+
+BCRYPT_ROUNDS sets the cost of new hashes. It is also the only accepted
+cost, so after it changes every stored hash with a different cost is
+flagged by `verify_and_update_password` and re-hashed at the next login.
+
+requirements.txt pins bcrypt<4.1: passlib 1.7.4 reads `bcrypt.__about__`,
+which 4.1 removed, and bcrypt 5 rejects passwords longer than 72 bytes
+where passlib's backend self-test still passes one.
+"""
+import os
+from passlib.context import CryptContext
+from concurrency import BoundedExecutor, ExecutorSaturated, saturated_response
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_MAX_QUEUE = int(os.getenv("PASSWORD_MAX_QUEUE", "64"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+password_executor = BoundedExecutor("password", PASSWORD_WORKERS, PASSWORD_MAX_QUEUE)
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+async def hash_password(password: str) -> str:
+    try:
+        return await password_executor.run(get_password_hash, password)
+    except ExecutorSaturated as e:
+        raise saturated_response(e)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """
+    Returns (valid, new_hash); `new_hash` is set when the password is valid
+    but its stored hash was made with another cost and should be replaced.
+    """
+    try:
+        return await password_executor.run(pwd_context.verify_and_update, plain_password, hashed_password)
+    except ExecutorSaturated as e:
+        raise saturated_response(e)
@@ -0,0 +1,115 @@
+"""
+Lazily loaded heavy resources (ML models, external clients).
+
+Modules declare their expensive objects with `lazy_resource(name, loader)`
+instead of building them at import time, so the API can start serving
+light routes immediately. A resource is built on first `.get()` (or by
+`warm_resources()` in the background, required ones first) exactly once, even under concurrent
+first use, and `resource_status()` reports what is loaded for the health
+endpoints.
+
+A resource may also declare a `warmup(value)` callable, run once right after
+loading, that pushes a synthetic input through the model so graph tracing and
+buffer allocation are paid before the first real request. Resources marked
+`required` gate readiness: `is_ready()` is true only once all of them are
+loaded and warmed.
+"""
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class LazyResource:
+    def __init__(self, name, loader, warm_on_startup=True, warmup=None, required=False):
+        self.name = name
+        self.loader = loader
+        self.warm_on_startup = warm_on_startup
+        self.warmup = warmup
+        self.required = required
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.error = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                start = time.perf_counter()
+                try:
+                    value = self.loader()
+                    loaded_at = time.perf_counter()
+                    if self.warmup is not None:
+                        self.warmup(value)
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_seconds = round(loaded_at - start, 3)
+                if self.warmup is not None:
+                    self.warmup_seconds = round(time.perf_counter() - loaded_at, 3)
+                self._value = value
+                self.error = None
+                self._loaded = True
+                logger.info("Loaded %s in %.1fs (warm-up %.1fs)", self.name, self.load_seconds, self.warmup_seconds or 0)
+        return self._value
+
+    def status(self):
+        return {
+            "loaded": self._loaded,
+            "required": self.required,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
+
+_resources = {}
+
+def lazy_resource(name, loader, warm_on_startup=True, warmup=None, required=False):
+    resource = LazyResource(name, loader, warm_on_startup, warmup, required)
+    _resources[name] = resource
+    return resource
+
+def resource_status():
+    return {name: resource.status() for name, resource in _resources.items()}
+
+def is_ready():
+    return all(resource.loaded for resource in _resources.values() if resource.required)
+
+def _warm(resource):
+    try:
+        resource.get()
+    except Exception:
+        logger.exception("Failed to load %s", resource.name)
+
+def warm_resources():
+    """
+    Loads every resource flagged `warm_on_startup` in the background. Required
+    resources each get their own thread, so readiness waits only on the
+    slowest of them; optional ones (external clients) load afterwards and
+    never hold readiness up. Returns the warm-up threads.
+    """
+    resources = [resource for resource in _resources.values() if resource.warm_on_startup]
+    required = [
+        threading.Thread(target=_warm, args=(resource,), name=f"warmup-{resource.name}", daemon=True)
+        for resource in resources if resource.required
+    ]
+
+    def warm_optional():
+        for thread in required:
+            thread.join()
+        for resource in resources:
+            if not resource.required:
+                _warm(resource)
+
+    threads = required + [threading.Thread(target=warm_optional, name="warmup-optional", daemon=True)]
+    for thread in threads:
+        thread.start()
+    return threads
@@ -1,32 +1,57 @@
 import os
-from datetime import datetime, timedelta
+import json
+import base64
+from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import List, Optional
 from fastapi.staticfiles import StaticFiles
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, EmailStr, Field
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
-from passlib.context import CryptContext
-import jwt
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from VisionModel.ai_model import router as ai_router
+from VisionModel.jobs import job_manager
+from VisionModel.uploads import router as upload_router
 from fastapi.middleware.cors import CORSMiddleware
 from RAG.app import route_rag
-from VisionModel.yolo_api import router as yolo_router
+from VisionModel.yolo_api import router as yolo_router, yolo_executor
+from registry import resource_status, warm_resources, is_ready
+import database
+from database import get_db
+from passwords import hash_password, verify_and_update_password, password_executor
+from auth import create_access_token, get_current_user, require_role
 # -----------------------
 # Load environment variables
 # -----------------------
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 
 load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
+WARM_MODELS_ON_STARTUP = os.getenv("WARM_MODELS_ON_STARTUP", "1") == "1"
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
 
 # -----------------------
 # Setup FastAPI and Database
 # -----------------------
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    database.connect()
+    await database.ensure_indexes()
+    # Models load in the background so the server accepts requests right away
+    if WARM_MODELS_ON_STARTUP:
+        warm_resources()
+    try:
+        yield
+    finally:
+        job_manager.shutdown()
+        yolo_executor.shutdown()
+        password_executor.shutdown()
+        database.close()
+
+app = FastAPI(lifespan=lifespan)
 app.mount("/patient", StaticFiles(directory="patient"), name="patient")
 app.add_middleware(
     CORSMiddleware,
@@ -34,26 +59,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
-client = AsyncIOMotorClient(MONGO_URI)
-db = client.get_default_database()  # you can also use client["final-year"]
+# The shared Mongo client is opened at startup and closed at shutdown (see database.py)
 
 # -----------------------
-# Password Hashing and JWT Helpers
+# Access Checks (tokens are issued and verified in auth.py, passwords hashed in passwords.py)
 # -----------------------
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=1)):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + expires_delta
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm="HS256")
+def check_access(user: dict, owner_id: str, *other_roles: str):
+    """Lets the owner of a resource through, or any caller whose role is in `other_roles`."""
+    if user["id"] != owner_id and user["role"] not in other_roles:
+        raise HTTPException(status_code=403, detail="Access denied")
 
 # -----------------------
 # Utility for ObjectId conversion
@@ -73,6 +89,20 @@ class PyObjectId(ObjectId):
     def __modify_schema__(cls, field_schema):
         field_schema.update(type="string")
 
+# -----------------------
+# Pagination Helpers
+# -----------------------
+# List endpoints return one page as the body and the opaque cursor of the
+# next page in the X-Next-Cursor header (absent on the last page)
+def encode_cursor(position) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 # -----------------------
 # Pydantic Models
 # -----------------------
@@ -167,21 +197,25 @@ class SigninModel(BaseModel):
 # Create a new doctor
 @app.post("/doctors", response_model=DoctorOut, status_code=status.HTTP_201_CREATED)
 async def create_doctor(doctor: DoctorCreate):
-    if await db.doctors.find_one({"email": doctor.email}):
+    if await get_db().doctors.find_one({"email": doctor.email}):
         raise HTTPException(status_code=400, detail="Doctor already exists")
     doctor_data = doctor.dict()
-    doctor_data["password"] = get_password_hash(doctor.password)
+    doctor_data["password"] = await hash_password(doctor.password)
     doctor_data["role"] = "doctor"
     doctor_data["patients_monitored"] = []
-    result = await db.doctors.insert_one(doctor_data)
-    new_doctor = await db.doctors.find_one({"_id": result.inserted_id})
+    try:
+        result = await get_db().doctors.insert_one(doctor_data)
+    except DuplicateKeyError:
+        # Another request registered the same email since the check above
+        raise HTTPException(status_code=400, detail="Doctor already exists")
+    new_doctor = await get_db().doctors.find_one({"_id": result.inserted_id})
     new_doctor["_id"] = str(new_doctor["_id"])
     return new_doctor
 
 # Get doctor by id
 @app.get("/doctors/{id}", response_model=DoctorOut)
 async def get_doctor_by_id(id: str):
-    doctor = await db.doctors.find_one({"_id": ObjectId(id)})
+    doctor = await get_db().doctors.find_one({"_id": ObjectId(id)})
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
     doctor["_id"] = str(doctor["_id"])
@@ -189,22 +223,32 @@ async def get_doctor_by_id(id: str):
 
 # get the Assigned patients
 @app.get("/api/doctor/{doctor_id}/patients")
-async def get_doctor_patients(doctor_id: str):
+async def get_doctor_patients(doctor_id: str, user: dict = Depends(require_role("doctor"))):
+    # Identity and role come from the verified token, no doctor lookup needed for them
+    check_access(user, doctor_id)
     try:
-        doctor = await db.doctors.find_one({"_id": ObjectId(doctor_id)})
+        doctor = await get_db().doctors.find_one(
+            {"_id": ObjectId(doctor_id)}, {"patients_monitored.patient_id": 1}
+        )
         if not doctor:
             raise HTTPException(status_code=404, detail="Doctor not found")
         
-        # Extract monitored patients with their details
-        patients = []
-        for monitored in doctor.get("patients_monitored", []):
-            patient = await db.patients.find_one({"_id": ObjectId(monitored["patient_id"])})
-            if patient:
-                patients.append({
-                    "_id": str(patient["_id"]),
-                    "name": patient["name"],
-                    "email": patient["email"]
-                })
+        # Fetch every monitored patient in one $in query, then restore the doctor's order
+        patient_ids = [
+            ObjectId(monitored["patient_id"])
+            for monitored in doctor.get("patients_monitored", [])
+            if ObjectId.is_valid(monitored["patient_id"])
+        ]
+        cursor = get_db().patients.find({"_id": {"$in": patient_ids}}, {"name": 1, "email": 1})
+        found = {patient["_id"]: patient async for patient in cursor}
+        patients = [
+            {
+                "_id": str(patient_id),
+                "name": found[patient_id]["name"],
+                "email": found[patient_id]["email"]
+            }
+            for patient_id in patient_ids if patient_id in found
+        ]
         
         return patients
     except Exception as e:
@@ -217,12 +261,12 @@ async def monitor_patient(
     medication: MonitoredMedication  # Use the existing MonitoredMedication model
 ):
     # Check if the doctor exists
-    doctor = await db.doctors.find_one({"_id": ObjectId(doctor_id)})
+    doctor = await get_db().doctors.find_one({"_id": ObjectId(doctor_id)})
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
 
     # Check if the patient exists
-    patient = await db.patients.find_one({"_id": ObjectId(patient_id)})
+    patient = await get_db().patients.find_one({"_id": ObjectId(patient_id)})
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
 
@@ -234,13 +278,13 @@ async def monitor_patient(
 
     if patient_monitored:
         # If the patient is already monitored, add the medication to the list
-        await db.doctors.update_one(
+        await get_db().doctors.update_one(
             {"_id": ObjectId(doctor_id), "patients_monitored.patient_id": patient_id},
             {"$push": {"patients_monitored.$.medications_given": medication.dict()}},
         )
     else:
         # If the patient is not monitored, add the patient to the list with the medication
-        await db.doctors.update_one(
+        await get_db().doctors.update_one(
             {"_id": ObjectId(doctor_id)},
             {"$push": {"patients_monitored": {
                 "patient_id": patient_id,
@@ -255,7 +299,7 @@ async def monitor_patient(
 
     if doctor_id not in patient["doctor_id"]:
         # Add the doctor to the patient's doctor_id array
-        await db.patients.update_one(
+        await get_db().patients.update_one(
             {"_id": ObjectId(patient_id)},
             {"$push": {"doctor_id": doctor_id}},
         )
@@ -264,36 +308,61 @@ async def monitor_patient(
     return {"message": "Patient monitored and medication added successfully"}
 
 @app.get("/doctor/patients/", response_model=List[MonitoredPatient])
-async def get_doctor_patients(doctor_id: str):
+async def get_monitored_patients(
+    doctor_id: str,
+    response: Response,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    include_medications: bool = True,
+    user: dict = Depends(require_role("doctor")),
+):
     """
-    Get all patients monitored by a specific doctor
+    Get the patients monitored by a specific doctor, one page at a time.
+    With include_medications=false the medication history is left out.
     """
-    doctor = await db.doctors.find_one({"_id": ObjectId(doctor_id)})
-    if not doctor:
+    check_access(user, doctor_id)
+    offset = decode_cursor(cursor) if cursor else 0
+    if not isinstance(offset, int) or offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Slice the embedded array on the server so only one page leaves the database
+    pipeline = [
+        {"$match": {"_id": ObjectId(doctor_id)}},
+        {"$project": {"_id": 0, "patients": {"$slice": [{"$ifNull": ["$patients_monitored", []]}, offset, limit + 1]}}},
+    ]
+    if not include_medications:
+        pipeline.append({"$project": {"patients.medications_given": 0}})
+    doctors = await get_db().doctors.aggregate(pipeline).to_list(1)
+    if not doctors:
         raise HTTPException(status_code=404, detail="Doctor not found")
     
-    # Return the list of monitored patients
-    return doctor.get("patients_monitored", [])
+    patients = doctors[0]["patients"]
+    if len(patients) > limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(offset + limit)
+    return patients[:limit]
 # Patients API
 
 # Create a new patient
 @app.post("/patients", response_model=PatientOut, status_code=status.HTTP_201_CREATED)
 async def create_patient(patient: PatientCreate):
-    if await db.patients.find_one({"email": patient.email}):
+    if await get_db().patients.find_one({"email": patient.email}):
         raise HTTPException(status_code=400, detail="Patient already exists")
     patient_data = patient.dict()
-    patient_data["password"] = get_password_hash(patient.password)
+    patient_data["password"] = await hash_password(patient.password)
     patient_data["role"] = "patient"
     patient_data["medical_records"] = []
-    result = await db.patients.insert_one(patient_data)
-    new_patient = await db.patients.find_one({"_id": result.inserted_id})
+    try:
+        result = await get_db().patients.insert_one(patient_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Patient already exists")
+    new_patient = await get_db().patients.find_one({"_id": result.inserted_id})
     new_patient["_id"] = str(new_patient["_id"])
     return new_patient
 
 # Get patient by id
 @app.get("/patients/{id}", response_model=PatientOut)
 async def get_patient_by_id(id: str):
-    patient = await db.patients.find_one({"_id": ObjectId(id)})
+    patient = await get_db().patients.find_one({"_id": ObjectId(id)})
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
     patient["_id"] = str(patient["_id"])
@@ -306,7 +375,7 @@ app.mount("/reports", StaticFiles(directory="patient"), name="reports")
 @app.get("/api/report/{report_id}")
 async def get_report(report_id: str):
     try:
-        report = await db.reports.find_one({"_id": ObjectId(report_id)})
+        report = await get_db().reports.find_one({"_id": ObjectId(report_id)})
         if not report:
             raise HTTPException(status_code=404, detail="Report not found")
         
@@ -323,17 +392,27 @@ async def get_report(report_id: str):
 
 # Add this to your FastAPI app
 @app.get("/api/patient/{patient_id}/reports")
-async def get_patient_reports(patient_id: str):
+async def get_patient_reports(patient_id: str, user: dict = Depends(get_current_user)):
+    # Patients see their own reports; doctors only those of patients they monitor
+    if user["role"] == "patient":
+        check_access(user, patient_id)
     try:
         # Fetch the patient to verify they exist
-        patient = await db.patients.find_one({"_id": ObjectId(patient_id)})
+        patient = await get_db().patients.find_one({"_id": ObjectId(patient_id)}, {"report_ids": 1, "doctor_id": 1})
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
+        if user["role"] == "doctor" and user["id"] not in patient.get("doctor_id", []):
+            raise HTTPException(status_code=403, detail="Access denied")
         
-        # Fetch all reports for this patient
+        # Fetch all reports for this patient in one $in query, kept in report_ids order
+        report_ids = [ObjectId(report_id) for report_id in patient.get("report_ids", []) if ObjectId.is_valid(report_id)]
+        cursor = get_db().reports.find(
+            {"_id": {"$in": report_ids}}, {"name": 1, "timestamp": 1, "doctor_id": 1, "html_path": 1}
+        )
+        found = {report["_id"]: report async for report in cursor}
         reports = []
-        for report_id in patient.get("report_ids", []):
-            report = await db.reports.find_one({"_id": ObjectId(report_id)})
+        for report_id in report_ids:
+            report = found.get(report_id)
             if report:
                 reports.append({
                     "id": str(report["_id"]),
@@ -343,39 +422,70 @@ async def get_patient_reports(patient_id: str):
                     "html_path": report.get("html_path", "")
                 })
         
-        # Get doctor names for each report
+        # Get doctor names for all reports with one more $in query
+        doctor_ids = {ObjectId(report["doctor_id"]) for report in reports if ObjectId.is_valid(report["doctor_id"])}
+        cursor = get_db().doctors.find({"_id": {"$in": list(doctor_ids)}}, {"name": 1})
+        doctor_names = {str(doctor["_id"]): doctor.get("name", "Unknown Doctor") async for doctor in cursor}
         for report in reports:
-            if report["doctor_id"]:
-                doctor = await db.doctors.find_one({"_id": ObjectId(report["doctor_id"])})
-                if doctor:
-                    report["doctor_name"] = doctor.get("name", "Unknown Doctor")
+            if report["doctor_id"] in doctor_names:
+                report["doctor_name"] = doctor_names[report["doctor_id"]]
         
         return reports
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
 @app.put("/patients/{id}/medical-records", response_model=PatientOut)
 async def update_medical_records(id: str, medical_records: List[MedicalRecord]):
-    patient = await db.patients.find_one({"_id": ObjectId(id)})
+    patient = await get_db().patients.find_one({"_id": ObjectId(id)})
     
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
 
     # Append the new medical records to the existing ones
     updated_data = {"$push": {"medical_records": {"$each": jsonable_encoder(medical_records)}}}
-    await db.patients.update_one({"_id": ObjectId(id)}, updated_data)
+    await get_db().patients.update_one({"_id": ObjectId(id)}, updated_data)
 
     # Return updated patient data
-    updated_patient = await db.patients.find_one({"_id": ObjectId(id)})
+    updated_patient = await get_db().patients.find_one({"_id": ObjectId(id)})
     updated_patient["_id"] = str(updated_patient["_id"])  # Convert ObjectId to string
     return updated_patient
 
 @app.get("/patients-list")
-async def get_patients_list():
+async def get_patients_list(
+    response: Response,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+):
+    """
+    Patients ordered by name, one page at a time. `q` keeps only names that
+    start with it, ignoring case. Both the prefix range and the keyset
+    cursor run on the case-insensitive (name, _id) index.
+    """
+    filters = []
+    if q:
+        # U+FFFF sorts after every character under the index collation
+        filters.append({"name": {"$gte": q, "$lt": q + "\uffff"}})
+    if cursor:
+        position = decode_cursor(cursor)
+        if not (isinstance(position, list) and len(position) == 2 and ObjectId.is_valid(position[1])):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        name, last_id = position[0], ObjectId(position[1])
+        filters.append({"$or": [{"name": {"$gt": name}}, {"name": name, "_id": {"$gt": last_id}}]})
     try:
-        # Fetch all patients from the database
-        patients = await db.patients.find({}, {"_id": 1, "name": 1}).to_list(None)
+        patients = await get_db().patients.find(
+            {"$and": filters} if filters else {},
+            {"_id": 1, "name": 1},
+            collation=database.NAME_COLLATION,
+        ).sort([("name", 1), ("_id", 1)]).limit(limit + 1).to_list(limit + 1)
+
+        if len(patients) > limit:
+            patients = patients[:limit]
+            last = patients[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor([last["name"], str(last["_id"])])
 
         # Format the response
         patients_list = [
@@ -394,17 +504,20 @@ async def signup(data: SignupModel):
     role = data.role.lower()
     if role not in ["doctor", "patient"]:
         raise HTTPException(status_code=400, detail="Invalid role. Choose 'doctor' or 'patient'.")
-    collection = db.doctors if role == "doctor" else db.patients
+    collection = get_db().doctors if role == "doctor" else get_db().patients
     if await collection.find_one({"email": data.email}):
         raise HTTPException(status_code=400, detail="User already exists")
     user_data = data.dict()
-    user_data["password"] = get_password_hash(user_data["password"])
+    user_data["password"] = await hash_password(user_data["password"])
     user_data["role"] = role
     if role == "doctor":
         user_data.setdefault("patients_monitored", [])
     else:
         user_data.setdefault("medical_records", [])
-    result = await collection.insert_one(user_data)
+    try:
+        result = await collection.insert_one(user_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User already exists")
     user = await collection.find_one({"_id": result.inserted_id})
     
     user_id = str(user["_id"])
@@ -418,7 +531,7 @@ async def signin(data: SigninModel):
     email = data.email
     # Determine role based on email; for example, if it starts with "dr." we expect a doctor.
     role = "doctor" if email.startswith("dr.") else "patient"
-    collection = db.doctors if role == "doctor" else db.patients
+    collection = get_db().doctors if role == "doctor" else get_db().patients
     user = await collection.find_one({"email": email})
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
@@ -427,14 +540,42 @@ async def signin(data: SigninModel):
         raise HTTPException(status_code=403, detail="Access denied. Expected role: doctor")
     if role == "patient" and user.get("specialization"):
         raise HTTPException(status_code=403, detail="Access denied. Expected role: patient")
-    if not verify_password(data.password, user["password"]):
+    valid, new_hash = await verify_and_update_password(data.password, user["password"])
+    if not valid:
         raise HTTPException(status_code=400, detail="Invalid credentials")
+    if new_hash:
+        # Stored with an old bcrypt cost; upgrade it while we have the plain password
+        await collection.update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
     user_id = str(user["_id"])
     token = create_access_token({"id":user_id, "role": role})
     
     return {"message": f"Login successful as {role}", "token": token, "role": role,"id":user_id}
 
 app.include_router(ai_router, prefix="")
+app.include_router(upload_router, prefix="")
+
+@app.get("/health")
+def health():
+    return {
+        "status": "ok",
+        "resources": resource_status(),
+        "mri_workers": {"mode": job_manager.mode, "max_workers": job_manager.max_workers},
+        "executors": {"yolo": yolo_executor.metrics(), "password": password_executor.metrics()},
+    }
+
+@app.get("/health/live")
+def health_live():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def health_ready():
+    # Without startup warming, models load on first use and cannot gate traffic
+    ready = is_ready() or not WARM_MODELS_ON_STARTUP
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if ready else "warming", "resources": resource_status()},
+    )
+
 app.include_router(yolo_router, prefix="/yolo")
 
 # -----------------------
@@ -1,7 +1,8 @@
-import markdown
-from xhtml2pdf import pisa
-
 def convert_md_to_pdf(md_file):
+    # Imported on first use; only the PDF export routes need them
+    import markdown
+    from xhtml2pdf import pisa
+
     pdf_file = md_file.replace(".md", ".pdf")
     with open(md_file, "r", encoding="utf-8") as file:
         md_content = file.read()
@@ -29,6 +29,9 @@ function MRIDashboard() {
   const [patients, setPatients] = useState([]);
   const [selectedPatient, setSelectedPatient] = useState("");
   const [isGeneratingReport, setIsGeneratingReport] = useState(false);
+  // Each dashboard session works in its own study workspace on the backend
+  const [studyId, setStudyId] = useState(null);
+  const studyRequest = useRef(null);
   const role = localStorage.getItem("role");
 
   const AI_MODELS = [
@@ -89,7 +92,10 @@ function MRIDashboard() {
       try {
         const doctorId = localStorage.getItem("userId");
         const response = await fetch(
-          `http://localhost:8000/api/doctor/${doctorId}/patients`
+          `http://localhost:8000/api/doctor/${doctorId}/patients`,
+          {
+            headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
+          }
         );
         if (!response.ok) throw new Error("Failed to fetch patients");
         const data = await response.json();
@@ -220,13 +226,39 @@ function MRIDashboard() {
       },
     });
 
+  // Create the study on first use; both dropzones share the same request
+  const ensureStudy = () => {
+    if (!studyRequest.current) {
+      studyRequest.current = fetch("http://localhost:8000/api/mri/studies", {
+        method: "POST",
+      })
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+          }
+          return response.json();
+        })
+        .then((data) => {
+          setStudyId(data.study_id);
+          return data.study_id;
+        })
+        .catch((err) => {
+          studyRequest.current = null;
+          throw err;
+        });
+    }
+    return studyRequest.current;
+  };
+
   // Save file to backend
   const saveFileToBackend = async (file, fileType) => {
     try {
+      const study = await ensureStudy();
       const formData = new FormData();
       const newFileName = file.name.replace(".nii.gz", `_${fileType}.nii.gz`);
       const renamedFile = new File([file], newFileName, { type: file.type });
       formData.append(`${fileType}_file`, renamedFile);
+      formData.append("study_id", study);
 
       const response = await fetch(
         `http://localhost:8000/api/mri/upload/${fileType}`,
@@ -269,7 +301,7 @@ function MRIDashboard() {
             selectedImageType === "t1ce" ? t1ceFileName : flairFileName;
           await mriNv.loadVolumes([
             {
-              url: `backend/patient_data/mri_scans/user/${filename}`,
+              url: `backend/patient_data/mri_scans/${studyId}/${filename}`,
               colorMap: "gray",
               opacity: 1.0,
             },
@@ -315,6 +347,7 @@ function MRIDashboard() {
           body: JSON.stringify({
             t1ce_filename: t1ceFileName,
             flair_filename: flairFileName,
+            study_id: studyId,
           }),
         });
 
@@ -326,12 +359,12 @@ function MRIDashboard() {
         if (labelsNv) {
           await labelsNv.loadVolumes([
             {
-              url: `backend/patient_data/mri_scans/user/resize_t1ce.nii.gz`,
+              url: `backend/patient_data/mri_scans/${data.study_id}/${data.resized_t1ce_file}`,
               color: "gray",
               opacity: 0.5,
             },
             {
-              url: `backend/patient_data/mri_scans/user/${data.segmentation_file}`,
+              url: `backend/patient_data/mri_scans/${data.study_id}/${data.segmentation_file}`,
               colorMap: "winter",
               opacity: 1,
             },
@@ -344,6 +377,7 @@ function MRIDashboard() {
         const blob = await blobResponse.blob();
         formData.append("file", blob, "input_image.jpg");
         formData.append("model", selectedModel);
+        formData.append("response_format", "image");
 
         const endpoint =
           selectedModel === "tumor-seg-v1"
@@ -363,8 +397,8 @@ function MRIDashboard() {
           );
         }
 
-        const data = await response.json();
-        setResultImage(data.result.path);
+        const imageBlob = await response.blob();
+        setResultImage(URL.createObjectURL(imageBlob));
         toast.success("Inference completed successfully");
       }
     } catch (err) {
@@ -402,7 +436,7 @@ function MRIDashboard() {
 
       // Load JSON file
       const jsonResponse = await fetch(
-        "./backend/VisionModel/report/mri_report.json"
+        `./backend/patient_data/mri_scans/${studyId}/mri_report.json`
       );
       if (!jsonResponse.ok) {
         throw new Error(`Failed to load JSON file: ${jsonResponse.status}`);
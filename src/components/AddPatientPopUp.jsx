@@ -14,12 +14,20 @@ const AddPatientPopup = ({ onClose, onSubmit, isDark }) => {
   useEffect(() => {
     const fetchPatients = async () => {
       try {
-        const response = await fetch("http://127.0.0.1:8000/patients-list");
-        if (!response.ok) {
-          throw new Error("Failed to fetch patients");
+        // The list is paginated; follow X-Next-Cursor until the last page
+        const baseUrl = "http://127.0.0.1:8000/patients-list";
+        const allPatients = [];
+        let url = baseUrl;
+        while (url) {
+          const response = await fetch(url);
+          if (!response.ok) {
+            throw new Error("Failed to fetch patients");
+          }
+          allPatients.push(...(await response.json()));
+          const nextCursor = response.headers.get("X-Next-Cursor");
+          url = nextCursor ? `${baseUrl}?cursor=${encodeURIComponent(nextCursor)}` : null;
         }
-        const data = await response.json();
-        setPatients(data);
+        setPatients(allPatients);
       } catch (error) {
         console.error("Error fetching patients:", error);
       }
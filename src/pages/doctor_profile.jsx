@@ -45,7 +45,10 @@ const DoctorProfile = ({ isDark, setIsDark }) => {
   const handleViewReports = async (patientId) => {
     try {
       const response = await fetch(
-        `http://127.0.0.1:8000/api/patient/${patientId}/reports`
+        `http://127.0.0.1:8000/api/patient/${patientId}/reports`,
+        {
+          headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
+        }
       );
       if (!response.ok) {
         throw new Error("Failed to fetch reports");
@@ -32,6 +32,7 @@ function PatientsDashboard({ isDark }) {
           `http://localhost:8000/api/patient/${patientId}/reports`,
           {
             credentials: "include",
+            headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
           }
         );
         console.log(response);